@@ -1,3 +1,5 @@
+from functools import cached_property
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -7,8 +9,42 @@ class Settings(BaseSettings):
     DB_USER: str = "postgres"
     DB_PASSWORD: str = "postgres"
     DB_NAME: str = "nl2sql"
+    # Up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections per worker process; size the sum
+    # against the server's max_connections divided by the number of workers
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_WRITE_BATCH_SIZE: int = 5000
+    METADATA_CACHE_TTL_SECONDS: int = 10
+
+    # LLM settings
+    LLM_MAX_CONCURRENCY: int = 4
+    LLM_POOL_MAX_CONNECTIONS: int = 100
+    LLM_POOL_MAX_KEEPALIVE: int = 50
+
+    # Context settings
+    KG_LOOKUP_MAX_WORKERS: int = 16
+    QUERY_EMBEDDING_CACHE_MAX: int = 10_000
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS: int = 3600
+    KG_MEMORY_MAX: int = 1024
+    KG_MEMORY_TTL_SECONDS: int = 600
+
+    # Session settings
+    SESSION_CACHE_MAX: int = 10_000
+    SESSION_TTL_SECONDS: int = 3600
+    HISTORY_MAX_TURNS: int = 200
+    HISTORY_FLUSH_INTERVAL: float = 0.2
+
+    # Completion cache settings
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_MAX: int = 1024
+    SEMANTIC_CACHE_TTL_SECONDS: int = 3600
+    SEMANTIC_CACHE_THRESHOLD: float = 0.9
+
+    # Upload settings
+    CSV_INGEST_MAX_CONCURRENCY: int = 2
     
-    @property
+    @cached_property
     def POSTGRES_URL(self) -> str:
         return f"postgresql+psycopg2://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
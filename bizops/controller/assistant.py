@@ -1,105 +1,202 @@
-from typing import Dict, Any, Optional, List, Tuple
-from fastapi import WebSocket
-from uuid_extensions import uuid7, uuid7str
-import time
-from bizops.services.agents.intention_agent import IntentionAgent
-from bizops.services.agents.planner_agent import PlannerAgent
-from bizops.services.agents.context_agent import ContextAgent
-from bizops.services.session_service import SessionService
+from collections import defaultdict
+from functools import cached_property
+from typing import AsyncIterator, Dict, Any, Optional, List, Tuple, Union, TYPE_CHECKING
+from fastapi import WebSocket, WebSocketDisconnect
+from uuid_extensions import uuid7str
+import asyncio
+import threading
+from bizops.config import settings
+from bizops.pkg.cache import hash_context
+from bizops.pkg.semantic_cache import SemanticCache
+from bizops.pkg.serialization import EventStream, send_json, send_text_stream
+from bizops.pkg.timeutil import now_iso
+
+if TYPE_CHECKING:
+    from bizops.services.agents.intention_agent import IntentionAgent
+    from bizops.services.agents.planner_agent import PlannerAgent
+    from bizops.services.agents.context_agent import ContextAgent
+    from bizops.services.embedding import EmbeddingService
+    from bizops.services.session_service import SessionService
+
+# Errors are returned either as a message or as the exception that was raised,
+# which is only formatted when rendered to the client
+Error = Union[str, Exception]
 
 class AssistantController:
     def __init__(self):
-        self.intention_agent = IntentionAgent()
-        self.planner_agent = PlannerAgent()
-        self.context_agent = ContextAgent()
-        self.session_service = SessionService()
+        # Agents and services are created on first use, see the properties below
+        # Bound the number of concurrent outbound agent calls
+        self._llm_sem = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        self._completion_cache = SemanticCache(
+            maxsize=settings.SEMANTIC_CACHE_MAX,
+            ttl=settings.SEMANTIC_CACHE_TTL_SECONDS,
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD
+        )
+        # Chat history is buffered per session and written behind by a background task
+        self._pending_history: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._history_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._history_flusher: Optional[asyncio.Task] = None
+        # Set when turns are queued, so the flusher sleeps while there is nothing to write
+        self._history_queued: Optional[asyncio.Event] = None
+
+    @cached_property
+    def intention_agent(self) -> "IntentionAgent":
+        from bizops.services.agents.intention_agent import IntentionAgent
+        return IntentionAgent()
+
+    @cached_property
+    def planner_agent(self) -> "PlannerAgent":
+        from bizops.services.agents.planner_agent import PlannerAgent
+        return PlannerAgent()
+
+    @cached_property
+    def context_agent(self) -> "ContextAgent":
+        from bizops.services.agents.context_agent import ContextAgent
+        return ContextAgent()
 
-    def chat_completions(self, query: str, context: Optional[Dict[str, Any]] = None, 
-                        session_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    @cached_property
+    def embedding_service(self) -> "EmbeddingService":
+        from bizops.services.embedding import get_embedding_service
+        return get_embedding_service()
+
+    @cached_property
+    def session_service(self) -> "SessionService":
+        from bizops.services.session_service import SessionService
+        return SessionService()
+
+    async def chat_completions(self, query: str, context: Optional[Dict[str, Any]] = None, 
+                               session_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Error]]:
         """
-        Handle synchronous chat completions requests
+        Handle chat completions requests
         Returns (response, error). If error is not None, response will be None.
         """
         try:
             # Get or create session
             if not session_id:
-                session = self.session_service.create_session(context=context)
+                session = await asyncio.to_thread(self.session_service.create_session, context=context)
                 session_id = session.session_id
                 context = session.context
             else:
-                session = self.session_service.get_session(session_id)
+                session = await asyncio.to_thread(self.session_service.get_session, session_id)
                 if not session:
                     return None, "Session not found or expired"
                 context = session.context
 
-            # Analyze user intention
-            intention = self.intention_agent.analyze_completion_intention(
-                query=query,
-                session_id=session_id,
-                context=context
-            )
-            
-            # Refine context based on intention
-            refined_context = self.context_agent.refine_context(session_id, intention)
-            
-            # Create execution plan only if intention is executable
-            plan = None
-            if intention["analysis"]["is_executable"]:
-                plan = self.planner_agent.create_plan(intention)
-            
-            # TODO: Execute plan and generate response
-            response_text = f"Generated response for: {query}"
+            # Semantically similar queries in the same session and context reuse an earlier
+            # completion's text and data
+            completion = None
+            if settings.SEMANTIC_CACHE_ENABLED:
+                scope = (session_id, hash_context(context))
+                query_embedding = await self.embedding_service.embed_model.aget_query_embedding(query)
+                cached = self._completion_cache.get(query_embedding, scope)
+                if cached is not None:
+                    # The request still gets its own intention in this session
+                    async with self._llm_sem:
+                        intention = await self.intention_agent.aanalyze_completion_intention(
+                            query=query,
+                            session_id=session_id,
+                            context=context
+                        )
+                    completion = {**cached, "intention_id": intention["metadata"]["intention_id"]}
+            if completion is None:
+                completion = await self._complete(query, session_id, context)
+                if settings.SEMANTIC_CACHE_ENABLED:
+                    self._completion_cache.put(
+                        query_embedding, {"text": completion["text"], "data": completion["data"]}, scope
+                    )
+
+            response_text = completion["text"]
+            intention_id = completion["intention_id"]
+            request_id = uuid7str()
             
             response = {
                 "text": response_text,
-                "data": {
-                    "tokens_used": 50,
-                    "model": "default-completion-model",
-                    "intention": intention["analysis"],
-                    "context": refined_context["data"],
-                    "plan": plan and {
-                        "id": plan["plan_id"],
-                        "tasks": [{"type": t["type"], "status": t["status"]} for t in plan["tasks"]]
-                    }
-                },
+                "data": completion["data"],
                 "context": context,
                 "metadata": {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
-                    "request_id": str(uuid7()),
-                    "intention_id": intention["metadata"]["intention_id"],
+                    "timestamp": now_iso(),
+                    "request_id": request_id,
+                    "intention_id": intention_id,
                     "session_id": session_id
                 }
             }
 
             # Update session context with response data
-            if response["context"]:
-                session.update_context(response["context"])
+            if context:
+                await asyncio.to_thread(session.update_context, context)
 
             # Add to chat history
-            success, error = self._add_to_chat_history(session_id, query, response)
-            if not success:
-                return None, error
+            self._add_to_chat_history(
+                session_id, query,
+                intention_id=intention_id,
+                request_id=request_id,
+                assistant_text=response_text
+            )
 
             return response, None
 
         except Exception as e:
-            return None, f"Error in chat completions: {str(e)}"
+            return None, e
 
-    async def handle_websocket_chat(self, websocket: WebSocket, message: str, context: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    async def _complete(self, query: str, session_id: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run the intention, context and planning pipeline for a completion request
+        Returns the response text, data and intention id
+        """
+        # Analyze user intention
+        async with self._llm_sem:
+            intention = await self.intention_agent.aanalyze_completion_intention(
+                query=query,
+                session_id=session_id,
+                context=context
+            )
+        
+        analysis = intention["analysis"]
+        # Embed the context search query while waiting for a free agent slot
+        self.context_agent.prefetch_query_embedding(intention)
+        try:
+            # Refine context based on intention
+            async with self._llm_sem:
+                refined_context = await self.context_agent.arefine_context(session_id, intention)
+        finally:
+            self.context_agent.discard_prefetched_embedding(intention["id"])
+        
+        # Create execution plan only if intention is executable
+        plan = None
+        if analysis["is_executable"]:
+            async with self._llm_sem:
+                plan = await self.planner_agent.create_plan(intention)
+        
+        # TODO: Execute plan and generate response
+        return {
+            "text": f"Generated response for: {query}",
+            "data": {
+                "tokens_used": 50,
+                "model": "default-completion-model",
+                "intention": analysis,
+                "context": refined_context["data"],
+                "plan": self._plan_summary(plan)
+            },
+            "intention_id": intention["metadata"]["intention_id"]
+        }
+
+    async def handle_websocket_chat(self, websocket: WebSocket, message: str, context: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Error]]:
         """
         Handle WebSocket chat messages
         """
         try:
             # Create or get session from websocket state
-            if not hasattr(websocket.state, "session"):
-                websocket.state.session = self.session_service.create_session(context=context)
-            session = websocket.state.session
+            session = getattr(websocket.state, "session", None)
+            if session is None:
+                session = await asyncio.to_thread(self.session_service.create_session, context=context)
+                websocket.state.session = session
 
             # Update session context if provided
             if context:
-                session.update_context(context)
+                await asyncio.to_thread(session.update_context, context)
 
-            response, error = self.chat_completions(
+            response, error = await self.chat_completions(
                 query=message,
                 context=session.context,
                 session_id=session.session_id
@@ -108,41 +205,117 @@ class AssistantController:
             return response, error
 
         except Exception as e:
-            return None, f"Error in websocket chat: {str(e)}"
+            return None, e
 
-    def end_session(self, session_id: str) -> Tuple[bool, Optional[str]]:
+    async def end_session(self, session_id: str) -> Tuple[bool, Optional[str]]:
         """
         End a chat session
         Returns (success, error). If error is not None, success will be False.
         """
-        return self.session_service.end_session(session_id)
+        await asyncio.to_thread(self.flush_history, session_id)
+        return await asyncio.to_thread(self.session_service.end_session, session_id)
 
-    def get_chat_history(self, session_id: str) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+    async def get_chat_history(self, session_id: str) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
         """
         Retrieve chat history for a given session
         Returns (history, error). If error is not None, history will be None.
         """
-        return self.session_service.get_chat_history(session_id)
+        await asyncio.to_thread(self.flush_history, session_id)
+        return await asyncio.to_thread(self.session_service.get_chat_history, session_id)
 
-    def _add_to_chat_history(self, session_id: str, message: str, 
-                           response: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+    def _add_to_chat_history(self, session_id: str, message: str, *,
+                             intention_id: str, request_id: str,
+                             assistant_text: str) -> None:
         """
-        Add a chat interaction to the session history
-        Returns (success, error). If error is not None, success will be False.
+        Queue a chat interaction for the session history
+        The message is written by the background flusher, see flush_history
         """
         chat_message = {
             "user": message,
-            "assistant": response["text"],
+            "assistant": assistant_text,
+            "timestamp": now_iso(),
             "metadata": {
-                "intention_id": response["metadata"]["intention_id"],
-                "request_id": response["metadata"]["request_id"]
+                "intention_id": intention_id,
+                "request_id": request_id
             }
         }
-        return self.session_service.add_to_chat_history(session_id, chat_message)
+        with self._history_lock:
+            self._pending_history[session_id].append(chat_message)
+        self._ensure_history_flusher()
+        self._history_queued.set()
+
+    def _ensure_history_flusher(self) -> None:
+        """
+        Start the history flusher on the running event loop if it is not running yet
+        """
+        loop = asyncio.get_running_loop()
+        flusher = self._history_flusher
+        if flusher is None or flusher.done() or flusher.get_loop() is not loop:
+            self._history_queued = asyncio.Event()
+            self._history_flusher = loop.create_task(self._flush_history_loop())
+
+    async def _flush_history_loop(self) -> None:
+        """
+        Write buffered chat history once turns are queued, flushing what is left when cancelled
+        """
+        queued = self._history_queued
+        try:
+            while True:
+                await queued.wait()
+                # Let turns queued in the meantime go out in the same write
+                await asyncio.sleep(settings.HISTORY_FLUSH_INTERVAL)
+                queued.clear()
+                if self._pending_history:
+                    await asyncio.to_thread(self.flush_history)
+                # Turns re-queued after a failed write are retried on the next interval
+                if self._pending_history:
+                    queued.set()
+        finally:
+            await asyncio.to_thread(self.flush_history)
+
+    def flush_history(self, session_id: Optional[str] = None) -> None:
+        """
+        Write buffered chat history to the session store
+        Flushes every session unless a session_id is given
+        """
+        with self._flush_lock:
+            with self._history_lock:
+                if session_id is None:
+                    pending, self._pending_history = self._pending_history, defaultdict(list)
+                else:
+                    messages = self._pending_history.pop(session_id, None)
+                    pending = {session_id: messages} if messages else {}
+
+            for sid, messages in pending.items():
+                try:
+                    success, error = self.session_service.add_to_chat_history_bulk(sid, messages)
+                except Exception as e:
+                    # The store failed, so the turns go back to the front of the queue
+                    print(f"Failed to flush chat history for session {sid}, will retry: {str(e)}")
+                    with self._history_lock:
+                        self._pending_history[sid][:0] = messages
+                    continue
+                if not success:
+                    # The session is gone, so its turns have nowhere to go
+                    print(f"Dropped chat history for session {sid}: {error}")
+
+    async def close(self) -> None:
+        """
+        Stop the history flusher and write any buffered chat history
+        """
+        flusher, self._history_flusher = self._history_flusher, None
+        if flusher is not None and not flusher.done() and flusher.get_loop() is asyncio.get_running_loop():
+            flusher.cancel()
+            try:
+                await flusher
+            except asyncio.CancelledError:
+                pass
+        else:
+            await asyncio.to_thread(self.flush_history)
 
     async def chat(self, websocket: WebSocket, message: str, 
                   session_id: Optional[str] = None,
-                  context: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+                  context: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Error]]:
         """
         Handle WebSocket chat messages
         Returns (response, error). If error is not None, response will be None.
@@ -150,66 +323,173 @@ class AssistantController:
         try:
             # Get or create session
             if not session_id:
-                session = self.session_service.create_session(context=context)
+                session = await asyncio.to_thread(self.session_service.create_session, context=context)
                 session_id = session.session_id
                 context = session.context
             else:
-                session = self.session_service.get_session(session_id)
+                session = await asyncio.to_thread(self.session_service.get_session, session_id)
                 if not session:
                     return None, "Session not found or expired"
                 context = session.context
 
             # Analyze chat intention
-            intention = self.intention_agent.analyze_chat_intention(
-                message=message,
-                session_id=session_id,
-                context=context
-            )
+            async with self._llm_sem:
+                intention = await asyncio.to_thread(
+                    self.intention_agent.analyze_chat_intention,
+                    message=message,
+                    session_id=session_id,
+                    context=context
+                )
+            # Collect additional intentions predicted for this message
+            additional_intentions = [
+                self.intention_agent.get_intention(child_id)
+                for child_id in intention["relationships"]["child_intentions"]
+            ]
 
-            # Process intention similar to chat_completions
-            refined_context = self.context_agent.refine_context(session_id, intention)
-            
-            plan = None
-            if intention["analysis"]["is_executable"]:
-                plan = self.planner_agent.create_plan(intention)
+            analysis = intention["analysis"]
+            intention_id = intention["metadata"]["intention_id"]
+
+            # Embed the context search query while the intention is being sent
+            self.context_agent.prefetch_query_embedding(intention)
+            try:
+                await send_json(websocket, {"stage": "intention", "data": analysis})
+
+                # Process intention similar to chat_completions
+                async with self._llm_sem:
+                    refined_context = await self.context_agent.arefine_context(session_id, intention)
+            finally:
+                # Refine takes the prefetch, unless sending the intention failed
+                self.context_agent.discard_prefetched_embedding(intention["id"])
+
+            ctx_data = refined_context["data"]
+            await send_json(websocket, {"stage": "context", "data": ctx_data})
+
+            # Create plans for all executable intentions concurrently,
+            # sending each one as soon as it is ready
+            executable_intentions = [
+                i for i in [intention, *additional_intentions]
+                if i and i["analysis"]["is_executable"]
+            ]
+            plans = await self._create_plans(executable_intentions, websocket=websocket)
+            plan_dict = self._plan_summary(plans.get(intention_id))
+            additional_analyses = [
+                {
+                    "intention": i["analysis"],
+                    "plan_id": plans[i["id"]]["plan_id"] if i["id"] in plans else None
+                }
+                for i in additional_intentions if i
+            ]
+
+            # Stream the response text ahead of the complete frame
+            response_text = await send_text_stream(websocket, self._generate_response(message))
+            request_id = uuid7str()
 
             response = {
-                "text": f"Generated response for: {message}",  # TODO: Implement actual response generation
+                "text": response_text,
                 "data": {
                     "tokens_used": 50,
                     "model": "default-chat-model",
-                    "intention": intention["analysis"],
-                    "context": refined_context["data"],
-                    "plan": plan and {
-                        "id": plan["plan_id"],
-                        "tasks": [{"type": t["type"], "status": t["status"]} for t in plan["tasks"]]
-                    }
+                    "intention": analysis,
+                    "context": ctx_data,
+                    "plan": plan_dict,
+                    "additional_intentions": additional_analyses
                 },
                 "context": context,
                 "metadata": {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
-                    "request_id": str(uuid7()),
-                    "intention_id": intention["metadata"]["intention_id"],
+                    "timestamp": now_iso(),
+                    "request_id": request_id,
+                    "intention_id": intention_id,
                     "session_id": session_id
                 }
             }
 
             # Update session context with response data
-            if response["context"]:
-                session.update_context(response["context"])
+            if context:
+                await asyncio.to_thread(session.update_context, context)
 
             # Add to chat history
-            success, error = self._add_to_chat_history(session_id, message, response)
-            if not success:
-                return None, error
+            self._add_to_chat_history(
+                session_id, message,
+                intention_id=intention_id,
+                request_id=request_id,
+                assistant_text=response_text
+            )
 
             return response, None
 
+        except WebSocketDisconnect:
+            raise
         except Exception as e:
-            return None, f"Error in chat: {str(e)}"
+            return None, e
+
+    async def stream_chat(self, message: str, session_id: Optional[str] = None,
+                          context: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        Handle a chat message as a stream of Server-Sent Events
+        Yields the same frames as the WebSocket chat, ending with a "complete" or error frame
+        """
+        stream = EventStream()
+
+        async def run() -> None:
+            try:
+                response, error = await self.chat(stream, message, session_id=session_id, context=context)
+                if error:
+                    await send_json(stream, {"error": str(error), "status": "error"})
+                else:
+                    await send_json(stream, {"stage": "complete", **response})
+            finally:
+                await stream.close()
+
+        task = asyncio.create_task(run())
+        try:
+            async for event in stream.events():
+                yield event
+        finally:
+            # Stop the chat turn if the client went away before it finished
+            task.cancel()
+
+    @staticmethod
+    async def _generate_response(message: str) -> AsyncIterator[str]:
+        """
+        Generate the response text as a stream of chunks
+        """
+        # TODO: Implement actual response generation
+        yield f"Generated response for: {message}"
+
+    @staticmethod
+    def _plan_summary(plan: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Summarize a plan for the response payload
+        """
+        if plan is None:
+            return None
+        return {
+            "id": plan["plan_id"],
+            "tasks": [{"type": t["type"], "status": t["status"]} for t in plan["tasks"]]
+        }
+
+    async def _create_plans(self, intentions: List[Dict[str, Any]],
+                            websocket: Optional[WebSocket] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Create execution plans for several intentions concurrently
+        If a websocket is given, each plan is sent as a "plan" stage tagged with its
+        intention id, in completion order
+        Returns a dict of plans keyed by intention id
+        """
+        async def create_plan(intention: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+            async with self._llm_sem:
+                return intention["id"], await self.planner_agent.create_plan(intention)
+
+        plans = {}
+        for future in asyncio.as_completed([create_plan(i) for i in intentions]):
+            intention_id, plan = await future
+            plans[intention_id] = plan
+            if websocket is not None:
+                await send_json(websocket, {"stage": "plan", "id": intention_id, "data": self._plan_summary(plan)})
+        return plans
 
     def whisper(self, instruction: str, data: Optional[Dict[str, Any]] = None, 
-                context: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+                context: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Error]]:
         """
         Handle whisper requests for system instructions
         Returns (response, error). If error is not None, response will be None.
@@ -221,10 +501,10 @@ class AssistantController:
                 "data": data,
                 "context": context,
                 "metadata": {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
-                    "request_id": str(uuid7())
+                    "timestamp": now_iso(),
+                    "request_id": uuid7str()
                 }
             }
             return response, None
         except Exception as e:
-            return None, f"Error in whisper: {str(e)}"
\ No newline at end of file
+            return None, e
\ No newline at end of file
@@ -1,39 +1,74 @@
-from os import statvfs
+from typing import Iterator
+import asyncio
 import pandas as pd
+import pyarrow.csv as pacsv
 from fastapi import UploadFile
-from bizops.services.postgres import PostgresService
-from bizops.services.vector import VectorService
+from pydantic import BaseModel
+from bizops.config import settings
+from bizops.pkg.cache import TTLCache
+from bizops.pkg.csvio import PARSE_OPTIONS, header_names, text_convert_options
+from bizops.services.postgres import get_postgres_service
+from bizops.services.vector import get_vector_service
+
+_DATABASES_KEY = "databases"
+_TABLES_KEY = "tables"
+
+def _iter_csv(file: UploadFile) -> Iterator[pd.DataFrame]:
+    """Stream an uploaded CSV as DataFrames, one per record batch"""
+    # The header is consumed here, so the reader continues from the first row.
+    # Each record batch covers one read block, which bounds memory per chunk.
+    # Empty cells are read as nulls, matching pandas' default NaN handling.
+    names = header_names(file.file.readline())
+    read_options = pacsv.ReadOptions(use_threads=True, block_size=8 << 20, column_names=names)
+    convert_options = text_convert_options(names)
+    with pacsv.open_csv(file.file, read_options=read_options, parse_options=PARSE_OPTIONS,
+                        convert_options=convert_options) as reader:
+        for batch in reader:
+            yield batch.to_pandas(split_blocks=True)
+
+def _items_frame(items: list) -> pd.DataFrame:
+    """Build a DataFrame column by column from a list of dicts or pydantic models"""
+    rows = [item.model_dump() if isinstance(item, BaseModel) else item for item in items]
+    if not rows or not isinstance(rows[0], dict):
+        raise ValueError("Items must be a list of dictionaries")
+    return pd.DataFrame({key: [row.get(key) for row in rows] for key in rows[0]})
 
 class DBController:
     def __init__(self):
-        self.postgres_service = PostgresService()
-        self.vector_service = VectorService()
+        self.postgres_service = get_postgres_service()
+        self.vector_service = get_vector_service()
+        # Bound the number of uploads parsed and written at the same time
+        self._ingest_sem = asyncio.Semaphore(settings.CSV_INGEST_MAX_CONCURRENCY)
+        # Database and table listings, dropped whenever the underlying metadata is updated
+        self._listing_cache = TTLCache(maxsize=1024, ttl=settings.METADATA_CACHE_TTL_SECONDS)
 
     async def process_database_info(self, file: UploadFile) -> None:
         """Process and store database metadata"""
         try:
-            df = pd.read_csv(file.file)
-            self.postgres_service.update_database_info(df)
+            async with self._ingest_sem:
+                await asyncio.to_thread(self.postgres_service.update_database_info, _iter_csv(file))
         except Exception as e:
             raise Exception(f"Failed to process database info: {str(e)}")
         finally:
             file.file.close()
+            self._listing_cache.pop(_DATABASES_KEY)
 
     async def process_table_info(self, file: UploadFile, database_name: str) -> None:
         """Process and store table metadata"""
         try:
-            df = pd.read_csv(file.file)
-            self.postgres_service.update_table_info(df, database_name)
+            async with self._ingest_sem:
+                await asyncio.to_thread(self.postgres_service.update_table_info, _iter_csv(file), database_name)
         except Exception as e:
             raise Exception(f"Failed to process table info: {str(e)}")
         finally:
             file.file.close()
+            self._listing_cache.pop((_TABLES_KEY, database_name))
 
     async def process_table_details(self, file: UploadFile, database_name: str, table_name: str) -> None:
         """Process and store table details metadata"""
         try:
-            df = pd.read_csv(file.file)
-            self.postgres_service.update_table_details(df, database_name, table_name)
+            async with self._ingest_sem:
+                await asyncio.to_thread(self.postgres_service.update_table_details, _iter_csv(file), database_name, table_name)
         except Exception as e:
             raise Exception(f"Failed to process table details: {str(e)}")
         finally:
@@ -42,8 +77,8 @@ class DBController:
     async def process_query_examples(self, file: UploadFile, database_name: str) -> None:
         """Process and store query examples"""
         try:
-            df = pd.read_csv(file.file)
-            self.postgres_service.update_query_examples(df, database_name)
+            async with self._ingest_sem:
+                await asyncio.to_thread(self.postgres_service.update_query_examples, _iter_csv(file), database_name)
         except Exception as e:
             raise Exception(f"Failed to process query examples: {str(e)}")
         finally:
@@ -52,41 +87,34 @@ class DBController:
     async def update_database_info(self, items: list) -> None:
         """Update database information from JSON data"""
         try:
-            # Ensure items is a list of dictionaries before converting to DataFrame
-            if not items or not isinstance(items[0], dict):
-                raise ValueError("Items must be a list of dictionaries")
-                
-            # Convert list to DataFrame
-            df = pd.DataFrame(items)
+            df = _items_frame(items)
             
             # Update PostgreSQL database
-            self.postgres_service.update_database_info(df)
+            await asyncio.to_thread(self.postgres_service.update_database_info, [df])
         except Exception as e:
             raise Exception(f"Failed to update database info: {str(e)}")
+        finally:
+            self._listing_cache.pop(_DATABASES_KEY)
 
     async def update_table_info(self, database_name: str, items: list) -> None:
         """Update table information from JSON data"""
         try:
-            # Convert items list to DataFrame
-            df = pd.DataFrame(items)
+            df = _items_frame(items)
             
             # Update PostgreSQL database
-            self.postgres_service.update_table_info(df, database_name)
+            await asyncio.to_thread(self.postgres_service.update_table_info, [df], database_name)
         except Exception as e:
             raise Exception(f"Failed to update table info: {str(e)}")
+        finally:
+            self._listing_cache.pop((_TABLES_KEY, database_name))
 
     async def update_table_details(self, database_name: str, table_name: str, items: list) -> None:
         """Update table details information from JSON data"""
         try:
-            # Ensure items is a list of dictionaries before converting to DataFrame
-            if not items or not isinstance(items[0], dict):
-                raise ValueError("Items must be a list of dictionaries")
-                
-            # Convert list to DataFrame
-            df = pd.DataFrame(items)
+            df = _items_frame(items)
             
             # Update PostgreSQL database
-            self.postgres_service.update_table_details(df, database_name, table_name)
+            await asyncio.to_thread(self.postgres_service.update_table_details, [df], database_name, table_name)
         except Exception as e:
             raise Exception(f"Failed to update table details: {str(e)}")
     
@@ -94,34 +122,43 @@ class DBController:
         """Update query examples from JSON data"""
         try:
             # Update PostgreSQL database
-            self.postgres_service.update_query_examples(database_name, items)
+            await asyncio.to_thread(self.postgres_service.update_query_examples, [_items_frame(items)], database_name)
         except Exception as e:
             raise Exception(f"Failed to update query examples: {str(e)}")
         
     async def list_databases(self) -> list[str]:
         """List all databases"""
         try:
-            return self.postgres_service.list_databases()
+            databases = self._listing_cache.get(_DATABASES_KEY)
+            if databases is None:
+                databases = await asyncio.to_thread(self.postgres_service.list_databases)
+                self._listing_cache[_DATABASES_KEY] = databases
+            return databases
         except Exception as e:
             raise Exception(f"Failed to list databases: {str(e)}")
 
     async def list_tables(self, database_name: str) -> list[str]:
         """List all tables in a database"""
         try:
-            return self.postgres_service.list_tables(database_name)
+            key = (_TABLES_KEY, database_name)
+            tables = self._listing_cache.get(key)
+            if tables is None:
+                tables = await asyncio.to_thread(self.postgres_service.list_tables, database_name)
+                self._listing_cache[key] = tables
+            return tables
         except Exception as e:
             raise Exception(f"Failed to list tables: {str(e)}")
 
     async def get_table_details(self, database_name: str, table_name: str) -> list[dict]:
         """Get table details for a specific table in a database"""
         try:
-            return self.postgres_service.get_table_details(database_name, table_name)
+            return await asyncio.to_thread(self.postgres_service.get_table_details, database_name, table_name)
         except Exception as e:
             raise Exception(f"Failed to get table details: {str(e)}")
 
     async def list_query_examples(self, database_name: str, table_name: str) -> list[dict]:
         """List query examples"""
         try:
-            return self.vector_service.list_query_examples(database_name, table_name)
+            return await asyncio.to_thread(self.vector_service.list_query_examples, database_name, table_name)
         except Exception as e:
             raise Exception(f"Failed to list query examples: {str(e)}")
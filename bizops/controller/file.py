@@ -1,93 +1,139 @@
 import os
-import shutil
-from datetime import datetime
-from typing import List, Dict, Literal, Type, TypeVar, Any
+from functools import lru_cache
+from typing import BinaryIO, List, Dict, Literal, Type, TypeVar, Any
+import asyncio
+import time
 from fastapi import UploadFile
-from bizops.services.embedding import EmbeddingService
-import csv
+from pydantic import TypeAdapter
+from bizops.pkg.csvio import PARSE_OPTIONS, header_names, text_convert_options
+from bizops.services.embedding import get_embedding_service
 import aiofiles
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 
 # Create uploads directory if it doesn't exist
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1 << 20
 
 FileType = Literal["database", "table", "sample"]
 
+# File name prefixes and the file types they identify
+FILE_TYPE_PREFIXES = (("db_", "database"), ("tb_", "table"), ("sample_", "sample"))
+ALLOWED_EXTENSIONS = frozenset({".csv"})
+
+# Comma separated columns that are converted to lists
+LIST_COLUMNS = frozenset({"aliases", "keywords", "query"})
+_EMPTY_LIST = pa.scalar([], pa.list_(pa.string()))
+
+@lru_cache(maxsize=None)
+def _list_adapter(model_class: Type[Any]) -> TypeAdapter:
+    """Validator for a list of model_class, built once per class"""
+    return TypeAdapter(List[model_class])
+
 class FileController:
     def __init__(self):
-        self.embedding_service = EmbeddingService()
+        self.embedding_service = get_embedding_service()
 
     @staticmethod
     def generate_unique_filename(original_filename: str) -> str:
-        """Generate a unique filename by adding timestamp"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        """Generate a unique filename by adding a nanosecond timestamp"""
         name, ext = os.path.splitext(original_filename)
-        return f"{name}_{timestamp}{ext}"
+        return f"{name}_{time.time_ns()}{ext}"
 
     @staticmethod
     def identify_file_type(filename: str) -> FileType:
         """Identify the type of CSV file based on its prefix"""
-        if filename.startswith("db_"):
-            return "database"
-        elif filename.startswith("tb_"):
-            return "table"
-        elif filename.startswith("sample_"):
-            return "sample"
-        else:
-            raise ValueError("Invalid file prefix. File must start with 'db_', 'tb_', or 'sample_'")
+        for prefix, file_type in FILE_TYPE_PREFIXES:
+            if filename.startswith(prefix):
+                return file_type
+        raise ValueError("Invalid file prefix. File must start with 'db_', 'tb_', or 'sample_'")
 
     @staticmethod
     def validate_file_type(filename: str) -> None:
         """Validate if the file type is allowed"""
-        allowed_extensions = {'.csv'}
-        file_ext = os.path.splitext(filename)[1].lower()
+        dot = filename.rfind('.')
+        file_ext = filename[dot:].lower() if dot > 0 else ""
         
-        if file_ext not in allowed_extensions:
-            raise ValueError(f"File type not allowed. Allowed types: {', '.join(allowed_extensions)}")
+        if file_ext not in ALLOWED_EXTENSIONS:
+            raise ValueError(f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}")
 
     @staticmethod
     async def save_file(file: UploadFile, file_path: str) -> None:
         """Save the uploaded file to disk"""
         try:
-            # Use aiofiles for async file operations
+            # Starlette spools uploads larger than 1 MiB to disk, and those are copied inside
+            # the kernel; asking a smaller in-memory upload for its descriptor would spill it first
+            if hasattr(os, "sendfile") and (file.size or 0) > UPLOAD_CHUNK_SIZE:
+                try:
+                    await asyncio.to_thread(FileController._sendfile, file.file, file_path)
+                    return
+                except (OSError, AttributeError):
+                    # A platform that only sends to sockets, or a file without a descriptor
+                    pass
+
+            # Use aiofiles for async file operations, copying in fixed-size chunks
             async with aiofiles.open(file_path, "wb") as buffer:
-                content = await file.read()
-                await buffer.write(content)
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await buffer.write(chunk)
         except Exception as e:
             raise ValueError(f"Failed to save file: {str(e)}")
 
+    @staticmethod
+    def _sendfile(src: BinaryIO, file_path: str) -> None:
+        """Copy a disk-backed file to file_path with os.sendfile"""
+        src.flush()
+        src_fd = src.fileno()
+        offset = src.tell()
+        dst_fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            while sent := os.sendfile(dst_fd, src_fd, offset, UPLOAD_CHUNK_SIZE):
+                offset += sent
+        finally:
+            os.close(dst_fd)
+
     async def process_csv_file(self, file: UploadFile, model_class: Type[Any]) -> List[Any]:
         """Process a CSV file and convert its contents to a list of model objects"""
         try:
-            # Read the CSV file content asynchronously
-            content = (await file.read()).decode('utf-8')
+            # Parse and validate in a worker thread, streaming the upload from its file
+            items = await asyncio.to_thread(self._parse_csv, file.file, model_class)
             await file.seek(0)  # Reset file pointer for potential future reads
-            
-            # Parse CSV content
-            reader = csv.DictReader(content.splitlines())
-            items = []
-            
-            for row in reader:
-                # Clean up the row data - strip whitespace from keys and values
-                cleaned_row = {k.strip(): v.strip() if isinstance(v, str) else v 
-                             for k, v in row.items()}
-                
-                # Convert string lists to actual lists
-                for key, value in cleaned_row.items():
-                    if key in ['aliases', 'keywords', 'query']:
-                        if value:
-                            cleaned_row[key] = [item.strip() for item in value.split(',')]
-                        else:
-                            cleaned_row[key] = []
-                
-                # Create model instance
-                item = model_class(**cleaned_row)
-                items.append(item)
-            
             return items
         except Exception as e:
             raise ValueError(f"Failed to process CSV file: {str(e)}")
 
+    @staticmethod
+    def _parse_csv(f: BinaryIO, model_class: Type[Any]) -> List[Any]:
+        """Parse a CSV stream into a list of model objects"""
+        # Stream the rows after the header one record batch at a time,
+        # keeping empty cells as empty strings
+        names = header_names(f.readline())
+        read_options = pacsv.ReadOptions(block_size=UPLOAD_CHUNK_SIZE, column_names=names)
+        convert_options = text_convert_options(names, strings_can_be_null=False)
+        adapter = _list_adapter(model_class)
+        items = []
+        with pacsv.open_csv(f, read_options=read_options, parse_options=PARSE_OPTIONS,
+                            convert_options=convert_options) as reader:
+            for batch in reader:
+                # Clean up the columns - strip whitespace from names and values,
+                # and convert string lists to actual lists
+                columns = {}
+                for name, column in zip(batch.schema.names, batch.columns):
+                    name = name.strip()
+                    column = pc.utf8_trim_whitespace(column)
+                    if name in LIST_COLUMNS:
+                        column = pc.if_else(
+                            pc.equal(column, ""),
+                            _EMPTY_LIST,
+                            pc.split_pattern_regex(column, r"\s*,\s*")
+                        )
+                    columns[name] = column
+
+                # Create model instances, validating each batch's rows in one call
+                items.extend(adapter.validate_python(pa.table(columns).to_pylist()))
+        return items
+
     async def handle_file_upload(self, file: UploadFile, database_name: str) -> Dict:
         """Handle the complete file upload process"""
         if not database_name:
@@ -0,0 +1,17 @@
+from functools import lru_cache
+
+from bizops.controller.assistant import AssistantController
+from bizops.controller.db import DBController
+
+
+@lru_cache(maxsize=1)
+def get_assistant_controller() -> AssistantController:
+    """Get the shared AssistantController"""
+    return AssistantController()
+
+
+@lru_cache(maxsize=1)
+def get_db_controller() -> DBController:
+    """Get the shared DBController"""
+    return DBController()
+
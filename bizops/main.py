@@ -1,7 +1,17 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from bizops.deps import get_assistant_controller
+from bizops.pkg.http import close_http_clients
 from bizops.routers import symantic_layer, nl2sql
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await get_assistant_controller().close()
+    await close_http_clients()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.include_router(symantic_layer.router, prefix="/api/v1")
 app.include_router(nl2sql.router, prefix="/api/v1")
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+def hash_context(context: Optional[Dict[str, Any]]) -> Hashable:
+    """
+    Stable hash of a request context, used as part of cache keys
+    The chat history is left out, since it changes on every turn
+    """
+    if not context:
+        return None
+    items = sorted((key, value) for key, value in context.items() if key != "chat_history")
+    if not items:
+        return None
+    try:
+        return hash(tuple(items))
+    except TypeError:
+        # Nested (unhashable) values, fall back to hashing the serialized context
+        serialized = json.dumps(dict(items), sort_keys=True, default=str).encode()
+        return hashlib.blake2b(serialized, digest_size=16).hexdigest()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU mapping with an optional per-entry time to live
+
+    Entries are evicted least-recently-used first once maxsize is exceeded,
+    and expire ttl seconds after they were last set.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key: Hashable) -> Any:
+        with self._lock:
+            expires_at, value = self._data[key]
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                raise KeyError(key)
+            self._data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def values(self) -> List[Any]:
+        """Snapshot of the cached values, including ones that may have expired"""
+        with self._lock:
+            return [value for _, value in self._data.values()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
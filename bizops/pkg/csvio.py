@@ -0,0 +1,24 @@
+import csv
+from typing import List
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+
+def header_names(header: bytes) -> List[str]:
+    """Column names from a CSV header line"""
+    return next(csv.reader([header.decode("utf-8-sig")]))
+
+
+# Quoted cells may span lines, as DDL and query samples do
+PARSE_OPTIONS = pacsv.ParseOptions(newlines_in_values=True)
+
+
+def text_convert_options(names: List[str], strings_can_be_null: bool = True) -> pacsv.ConvertOptions:
+    """
+    Build Arrow convert options that read every named column as text
+    Type inference on the first block could otherwise disagree with later blocks
+    """
+    return pacsv.ConvertOptions(
+        column_types={name: pa.string() for name in names},
+        strings_can_be_null=strings_can_be_null
+    )
@@ -0,0 +1,22 @@
+from functools import lru_cache
+
+from sqlalchemy import Engine, create_engine
+
+from bizops.config import settings
+
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    """Get the shared database engine"""
+    return create_engine(
+        settings.POSTGRES_URL,
+        # Size the pool for the concurrent to_thread calls made by the async routes
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+        # Send executemany parameter sets to the server in pages rather than one round trip per row
+        executemany_mode="values_plus_batch",
+        executemany_batch_page_size=settings.DB_WRITE_BATCH_SIZE,
+        insertmanyvalues_page_size=settings.DB_WRITE_BATCH_SIZE
+    )
@@ -0,0 +1,42 @@
+from typing import Optional
+
+import httpx
+
+from bizops.config import settings
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """Get the shared sync HTTP client"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.Client(timeout=httpx.Timeout(60.0), limits=_limits())
+    return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Get the shared async HTTP client"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(timeout=httpx.Timeout(60.0), limits=_limits())
+    return _async_client
+
+
+async def close_http_clients() -> None:
+    """Close the shared HTTP clients, called on application shutdown"""
+    global _client, _async_client
+    if _client is not None:
+        _client.close()
+        _client = None
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
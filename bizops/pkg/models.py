@@ -1,6 +1,7 @@
 import os
+import threading
 from enum import Enum
-from typing import Dict, Any
+from typing import Dict, Any, Hashable, Optional, Tuple
 
 from llama_index.embeddings.dashscope import (
     DashScopeEmbedding,
@@ -13,6 +14,8 @@ from llama_index.llms.openai import OpenAI
 from llama_index.llms.azure_openai import AzureOpenAI
 from llama_index.embeddings.azure_openai import AzureOpenAIEmbedding
 
+from bizops.pkg.http import get_async_http_client, get_http_client
+
 
 class LLMType(Enum):
     GPT4O = "gpt-4o"
@@ -27,105 +30,155 @@ class EmbeddingType(Enum):
     AZURE_EMBEDDING = "text-embedding-3-large"
     AZURE_DIMENSION = 1536
 
+def _cache_key(model_type: Enum, kwargs: Dict[str, Any]) -> Optional[Tuple[Hashable, ...]]:
+    """Cache key for a model built with the given kwargs, None if they are not hashable"""
+    key = (model_type.value, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
 class ModelManager:
     _instance = None
-    _llm_cache: Dict[str, Any] = {}
-    _embedding_cache: Dict[str, Any] = {}
-    _initialized = False
+    _instance_lock = threading.Lock()
+    _llm_cache: Dict[Tuple[Hashable, ...], Any] = {}
+    _embedding_cache: Dict[Tuple[Hashable, ...], Any] = {}
+    # Guards the model caches so concurrent callers build each model once
+    _cache_lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(ModelManager, cls).__new__(cls)
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super(ModelManager, cls).__new__(cls)
+                    instance._load_credentials()
+                    # Publish only once fully initialized
+                    cls._instance = instance
         return cls._instance
 
-    def __init__(self):
-        if not self._initialized:
-            self.openai_api_key = os.getenv("OPENAI_API_KEY")
-            self.anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
-            self.dashscope_api_key = os.getenv("DASHSCOPE_API_KEY")
-            # Azure OpenAI credentials
-            self.azure_api_key = os.getenv("AZURE_OPENAI_API_KEY")
-            self.azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-            self._initialized = True
+    def _load_credentials(self):
+        """Read API credentials from the environment"""
+        env = os.environ
+        self.openai_api_key = env.get("OPENAI_API_KEY")
+        self.anthropic_api_key = env.get("ANTHROPIC_API_KEY")
+        self.dashscope_api_key = env.get("DASHSCOPE_API_KEY")
+        # Azure OpenAI credentials
+        self.azure_api_key = env.get("AZURE_OPENAI_API_KEY")
+        self.azure_endpoint = env.get("AZURE_OPENAI_ENDPOINT")
 
     @classmethod
     def get_instance(cls) -> 'ModelManager':
         """Get the singleton instance of ModelManager"""
-        if cls._instance is None:
-            cls._instance = cls()
-        return cls._instance
+        return cls._instance or cls()
 
     def get_llm(self, model_type: LLMType, **kwargs):
-        """Get LLM model instance by type."""
-        if model_type.value in self._llm_cache:
-            return self._llm_cache[model_type.value]
-
-        if model_type in [LLMType.GPT4O]:
-            model = OpenAI(
-                api_key=self.openai_api_key,
-                model=model_type.value,
-                temperature=kwargs.get('temperature', 0),
-                **kwargs
-            )
-        elif model_type == LLMType.AZURE_GPT4O:
-            model = OpenAI(
-                model=model_type.value,
-                temperature=kwargs.get('temperature', 0),
-                api_key=self.azure_api_key,
-                api_base=self.azure_endpoint,
-                api_type="azure",
-                api_version="2024-10-21",
-                deployment_name=LLMType.AZURE_GPT4O.value,
-                **kwargs
-            )
-        elif model_type == LLMType.CLAUDE:
-            model = Anthropic(
-                api_key=self.anthropic_api_key,
-                model=model_type.value,
-                temperature=kwargs.get('temperature', 0),
-                **kwargs
-            )
-        elif model_type == LLMType.QWEN:
-            model = DashScope(
-                api_key=self.dashscope_api_key,
-                model=model_type.value,
-                temperature=kwargs.get('temperature', 0),
-                **kwargs
-            )
-        else:
-            raise ValueError(f"Unsupported LLM type: {model_type}")
+        """Get LLM model instance by type, cached per type and kwargs."""
+        key = _cache_key(model_type, kwargs)
+        model = self._llm_cache.get(key)
+        if model is not None:
+            return model
 
-        self._llm_cache[model_type.value] = model
+        with self._cache_lock:
+            model = self._llm_cache.get(key)
+            if model is None:
+                model = self._build_llm(model_type, **kwargs)
+                if key is not None:
+                    self._llm_cache[key] = model
         return model
 
+    def _build_llm(self, model_type: LLMType, **kwargs):
+        """Create an LLM model instance"""
+        builder = self._LLM_BUILDERS.get(model_type)
+        if builder is None:
+            raise ValueError(f"Unsupported LLM type: {model_type}")
+        return builder(self, model_type, kwargs.pop('temperature', 0), **kwargs)
+
+    def _build_openai(self, model_type: LLMType, temperature: float, **kwargs):
+        return OpenAI(
+            api_key=self.openai_api_key,
+            model=model_type.value,
+            temperature=temperature,
+            http_client=get_http_client(),
+            async_http_client=get_async_http_client(),
+            **kwargs
+        )
+
+    def _build_anthropic(self, model_type: LLMType, temperature: float, **kwargs):
+        return Anthropic(
+            api_key=self.anthropic_api_key,
+            model=model_type.value,
+            temperature=temperature,
+            **kwargs
+        )
+
+    def _build_dashscope(self, model_type: LLMType, temperature: float, **kwargs):
+        return DashScope(
+            api_key=self.dashscope_api_key,
+            model=model_type.value,
+            temperature=temperature,
+            **kwargs
+        )
+
+    # AZURE_GPT4O shares GPT4O's value, so it is an alias that resolves to the GPT4O entry
+    _LLM_BUILDERS = {
+        LLMType.GPT4O: _build_openai,
+        LLMType.CLAUDE: _build_anthropic,
+        LLMType.QWEN: _build_dashscope,
+    }
+
     def get_embedding_model(self, model_type: EmbeddingType, **kwargs):
-        """Get embedding model instance by type."""
-        if model_type.value in self._embedding_cache:
-            return self._embedding_cache[model_type.value]
-
-        if model_type == EmbeddingType.AZURE_EMBEDDING:
-            model = AzureOpenAIEmbedding(
-                model=model_type.value,
-                deployment_name=model_type.value,
-                api_key=self.azure_api_key,
-                azure_endpoint=self.azure_endpoint,
-                api_version="2024-10-21",
-                dimensions=EmbeddingType.AZURE_DIMENSION.value,
-                **kwargs
-            )
-        elif model_type == EmbeddingType.QWEN_DOCUMENT:
-            model = DashScopeEmbedding(model_name=model_type.value, 
-                                       text_type=DashScopeTextEmbeddingType.TEXT_TYPE_DOCUMENT,)
-        elif model_type == EmbeddingType.QWEN_QUERY:
-            model = DashScopeEmbedding(model_name=model_type.value, 
-                                       text_type=DashScopeTextEmbeddingType.TEXT_TYPE_QUERY,)
-        else:
-            raise ValueError(f"Unsupported embedding type: {model_type}")
+        """Get embedding model instance by type, cached per type and kwargs."""
+        key = _cache_key(model_type, kwargs)
+        model = self._embedding_cache.get(key)
+        if model is not None:
+            return model
 
-        self._embedding_cache[model_type.value] = model
+        with self._cache_lock:
+            model = self._embedding_cache.get(key)
+            if model is None:
+                model = self._build_embedding_model(model_type, **kwargs)
+                if key is not None:
+                    self._embedding_cache[key] = model
         return model
 
+    def _build_embedding_model(self, model_type: EmbeddingType, **kwargs):
+        """Create an embedding model instance"""
+        builder = self._EMBEDDING_BUILDERS.get(model_type)
+        if builder is None:
+            raise ValueError(f"Unsupported embedding type: {model_type}")
+        return builder(self, model_type.value, **kwargs)
+
+    def _build_azure_embedding(self, model_name: str, **kwargs):
+        return AzureOpenAIEmbedding(
+            model=model_name,
+            deployment_name=model_name,
+            api_key=self.azure_api_key,
+            azure_endpoint=self.azure_endpoint,
+            api_version="2024-10-21",
+            dimensions=EmbeddingType.AZURE_DIMENSION.value,
+            http_client=get_http_client(),
+            async_http_client=get_async_http_client(),
+            **kwargs
+        )
+
+    def _build_qwen_document_embedding(self, model_name: str, **kwargs):
+        return DashScopeEmbedding(model_name=model_name,
+                                  text_type=DashScopeTextEmbeddingType.TEXT_TYPE_DOCUMENT,)
+
+    def _build_qwen_query_embedding(self, model_name: str, **kwargs):
+        return DashScopeEmbedding(model_name=model_name,
+                                  text_type=DashScopeTextEmbeddingType.TEXT_TYPE_QUERY,)
+
+    # QWEN_QUERY has the same value as QWEN_DOCUMENT and is an alias of it,
+    # so like AZURE_GPT4O above it resolves to the QWEN_DOCUMENT entry
+    _EMBEDDING_BUILDERS = {
+        EmbeddingType.AZURE_EMBEDDING: _build_azure_embedding,
+        EmbeddingType.QWEN_DOCUMENT: _build_qwen_document_embedding,
+    }
+
     def clear_cache(self):
         """Clear model caches."""
-        self._llm_cache.clear()
-        self._embedding_cache.clear()
\ No newline at end of file
+        with self._cache_lock:
+            self._llm_cache.clear()
+            self._embedding_cache.clear()
\ No newline at end of file
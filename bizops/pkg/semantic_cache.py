@@ -0,0 +1,81 @@
+import threading
+import time
+from typing import Any, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Thread-safe cache of values keyed by embedding similarity
+
+    A lookup hits when an entry stored under the same scope has a cosine
+    similarity of at least threshold with the query embedding. Entries expire
+    ttl seconds after they were stored, and the least recently used entry is
+    replaced once maxsize entries are held.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None, threshold: float = 0.9):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        # Unit-length embeddings, one row per slot, allocated on the first put
+        self._vectors: Optional[np.ndarray] = None
+        self._scopes: List[Hashable] = [None] * maxsize
+        self._values: List[Any] = [None] * maxsize
+        self._used = np.zeros(maxsize, dtype=bool)
+        self._expires_at = np.full(maxsize, np.inf)
+        self._last_used = np.zeros(maxsize)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding: Sequence[float], scope: Hashable = None) -> Optional[Any]:
+        """Value of the most similar live entry in scope, or None on a miss"""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                return None
+            live = self._used & (self._expires_at > now)
+            if not live.any():
+                return None
+            similarity = np.where(live, self._vectors @ query, -np.inf)
+            for slot in np.argsort(similarity)[::-1]:
+                if similarity[slot] < self.threshold:
+                    break
+                if self._scopes[slot] == scope:
+                    self._last_used[slot] = now
+                    return self._values[slot]
+            return None
+
+    def put(self, embedding: Sequence[float], value: Any, scope: Hashable = None) -> None:
+        """Store value under embedding, replacing an expired or the least recently used entry"""
+        vector = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+                self._used[:] = False
+            free = ~self._used | (self._expires_at <= now)
+            slot = int(np.argmax(free)) if free.any() else int(np.argmin(self._last_used))
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope
+            self._values[slot] = value
+            self._used[slot] = True
+            self._expires_at[slot] = now + self.ttl if self.ttl is not None else np.inf
+            self._last_used[slot] = now
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int((self._used & (self._expires_at > time.monotonic())).sum())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._used[:] = False
+            self._scopes = [None] * self.maxsize
+            self._values = [None] * self.maxsize
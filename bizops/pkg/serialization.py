@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any, AsyncIterable, AsyncIterator, List, Optional, Union
+
+import orjson
+from fastapi import WebSocket, WebSocketDisconnect
+
+
+async def send_json(websocket: WebSocket, data: Any) -> None:
+    """Send data over a WebSocket as a JSON text frame, serialized with orjson"""
+    await websocket.send_text(orjson.dumps(data).decode())
+
+
+async def receive_raw(websocket: WebSocket) -> Union[str, bytes]:
+    """Receive the raw payload of the next text or binary WebSocket frame"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    text = message.get("text")
+    return text if text is not None else message.get("bytes", b"")
+
+
+async def send_text_stream(websocket: WebSocket, chunks: AsyncIterable[str], stage: str = "text",
+                           max_chunks: int = 5, max_delay: float = 0.02) -> str:
+    """
+    Stream text chunks over a WebSocket as "text" stage frames and return the full text
+    Chunks are coalesced into one frame once max_chunks are buffered or max_delay
+    seconds have passed since the last frame, so small tokens do not cost a frame each
+    """
+    loop = asyncio.get_running_loop()
+    parts: List[str] = []
+    buffer: List[str] = []
+    last_flush = loop.time()
+    async for chunk in chunks:
+        parts.append(chunk)
+        buffer.append(chunk)
+        if len(buffer) >= max_chunks or loop.time() - last_flush >= max_delay:
+            await send_json(websocket, {"stage": stage, "data": "".join(buffer)})
+            buffer.clear()
+            last_flush = loop.time()
+    if buffer:
+        await send_json(websocket, {"stage": stage, "data": "".join(buffer)})
+    return "".join(parts)
+
+
+class EventStream:
+    """
+    Stand-in for a WebSocket that queues the frames sent to it as Server-Sent Events
+    Frames are sent with send_json as usual and read back with events()
+    """
+
+    def __init__(self):
+        self._queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+    async def send_text(self, data: str) -> None:
+        await self._queue.put(data)
+
+    async def close(self) -> None:
+        await self._queue.put(None)
+
+    async def events(self, ping_interval: float = 15.0) -> AsyncIterator[str]:
+        """Yield queued frames as SSE events until closed, with a comment ping when idle"""
+        while True:
+            try:
+                data = await asyncio.wait_for(self._queue.get(), ping_interval)
+            except asyncio.TimeoutError:
+                # Keeps proxies from timing out the connection during long agent calls
+                yield ": ping\n\n"
+                continue
+            if data is None:
+                return
+            yield f"data: {data}\n\n"
@@ -0,0 +1,20 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Tuple
+
+TZ_SHANGHAI = timezone(timedelta(hours=8))
+
+# (epoch second, formatted timestamp) of the last call
+_last: Tuple[int, str] = (0, "")
+
+
+def now_iso() -> str:
+    """Current time as an ISO 8601 string in UTC+8, formatted at most once per second"""
+    global _last
+    t = int(time.time())
+    cached_t, cached_s = _last
+    if cached_t == t:
+        return cached_s
+    s = datetime.fromtimestamp(t, tz=TZ_SHANGHAI).isoformat()
+    _last = (t, s)
+    return s
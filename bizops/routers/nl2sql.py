@@ -1,54 +1,36 @@
-from fastapi import APIRouter, WebSocket, HTTPException, Depends
-from pydantic import BaseModel
-import uuid
-from typing import Optional, Dict, Any, Union
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Depends
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Optional
 from bizops.controller.assistant import AssistantController
+from bizops.deps import get_assistant_controller
+from bizops.pkg.serialization import receive_raw, send_json
+from bizops.schemas import ChatRequest, CompletionsRequest, ResponseWrapper, WhisperRequest
 
 router = APIRouter(
     prefix="/nl2sql",
-    tags=["nl2sql"]
+    tags=["nl2sql"],
+    default_response_class=ORJSONResponse
 )
 
-# Initialize controller
-assistant_controller = AssistantController()
-
-class CompletionsRequest(BaseModel):
-    query: str
-    context: Optional[Dict[str, Any]] = None
-
-class WhisperRequest(BaseModel):
-    instruction: str
-    data: Optional[Dict[str, Any]] = None
-    context: Optional[Dict[str, Any]] = None
-
-class ResponseWrapper(BaseModel):
-    text: str
-    data: Optional[Dict[str, Any]] = None
-    context: Optional[Dict[str, Any]] = None
-    metadata: Optional[Dict[str, Any]] = None
-
-class ChatRequest(BaseModel):
-    message: str
-    session_id: Optional[str] = None
-    context: Optional[Dict[str, Any]] = None
-
-@router.post("/chat/completions", response_model=ResponseWrapper)
-def chat_completions(request: CompletionsRequest):
+@router.post("/chat/completions", responses={200: {"model": ResponseWrapper}})
+async def chat_completions(request: CompletionsRequest,
+                           assistant_controller: AssistantController = Depends(get_assistant_controller)):
     """
-    Synchronous completion API endpoint with enhanced response structure
+    Completion API endpoint with enhanced response structure
     """
-    response, error = assistant_controller.chat_completions(
+    response, error = await assistant_controller.chat_completions(
         query=request.query,
         context=request.context
     )
     if error:
-        raise HTTPException(status_code=500, detail=error)
+        raise HTTPException(status_code=500, detail=str(error))
     return response
 
-@router.post("/whisper", response_model=ResponseWrapper)
-def whisper(request: WhisperRequest):
+@router.post("/whisper", responses={200: {"model": ResponseWrapper}})
+async def whisper(request: WhisperRequest,
+                  assistant_controller: AssistantController = Depends(get_assistant_controller)):
     """
-    Synchronous whisper API for passing instructions or data without a chat window
+    Whisper API for passing instructions or data without a chat window
     """
     response, error = assistant_controller.whisper(
         instruction=request.instruction,
@@ -56,21 +38,24 @@ def whisper(request: WhisperRequest):
         context=request.context
     )
     if error:
-        raise HTTPException(status_code=500, detail=error)
+        raise HTTPException(status_code=500, detail=str(error))
     return response
 
 @router.websocket("/chat")
-async def chat(websocket: WebSocket):
+async def chat(websocket: WebSocket,
+               assistant_controller: AssistantController = Depends(get_assistant_controller)):
     """
     WebSocket endpoint for streaming chat responses with enhanced response structure
+    Sends "intention", "context" and "plan" stages as they become available,
+    then the response text in "text" frames, followed by a "complete" frame
+    carrying the full response
     """
     await websocket.accept()
     
     try:
         while True:
-            # Receive the chat request
-            data = await websocket.receive_json()
-            request = ChatRequest(**data)
+            # Receive the chat request, parsing and validating the raw frame in one step
+            request = ChatRequest.model_validate_json(await receive_raw(websocket))
 
             # Process chat message using controller
             response, error = await assistant_controller.chat(
@@ -81,29 +66,45 @@ async def chat(websocket: WebSocket):
             )
 
             if error:
-                await websocket.send_json({
-                    "error": error,
+                await send_json(websocket, {
+                    "error": str(error),
                     "status": "error"
                 })
                 continue
 
-            # Send response
-            await websocket.send_json(response)
+            # Send the complete response after the intermediate stages
+            await send_json(websocket, {"stage": "complete", **response})
 
+    except WebSocketDisconnect:
+        # The client is gone, so there is nothing left to send or close
+        return
     except Exception as e:
-        await websocket.send_json({
+        await send_json(websocket, {
             "error": str(e),
             "status": "error"
         })
-    finally:
         await websocket.close()
 
+@router.get("/chat/stream")
+async def chat_stream(message: str, session_id: Optional[str] = None,
+                      assistant_controller: AssistantController = Depends(get_assistant_controller)):
+    """
+    Server-Sent Events endpoint for clients that cannot use the WebSocket chat
+    Streams the same stage frames, followed by a "complete" frame carrying the full response
+    """
+    return StreamingResponse(
+        assistant_controller.stream_chat(message, session_id=session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
 @router.get("/chat/history/{session_id}")
-async def get_chat_history(session_id: str):
+async def get_chat_history(session_id: str,
+                           assistant_controller: AssistantController = Depends(get_assistant_controller)):
     """
     Get chat history for a session
     """
-    history, error = assistant_controller.get_chat_history(session_id)
+    history, error = await assistant_controller.get_chat_history(session_id)
     if error:
         raise HTTPException(status_code=404, detail=error)
     return {"history": history}
\ No newline at end of file
@@ -1,57 +1,25 @@
-from fastapi import APIRouter, UploadFile, File, Body
-from fastapi.responses import JSONResponse
+import re
+from fastapi import APIRouter, UploadFile, File, Body, Depends
+from fastapi.responses import ORJSONResponse
 from starlette import status
 from typing import Optional, List, Dict, Union
-from pydantic import BaseModel
 
 from bizops.controller.db import DBController
-from bizops.controller.file import FileController
+from bizops.deps import get_db_controller
+from bizops.schemas import DatabaseInfo, QueryExample, TableDetails, TableInfo, UpdateRequest
 
 router = APIRouter(
     prefix="/symantic-layer",
-    tags=["symantic-layer"]
+    tags=["symantic-layer"],
+    default_response_class=ORJSONResponse
 )
 
-db_controller = DBController()
-
-# Pydantic models for request validation
-class DatabaseInfo(BaseModel):
-    database_name: str
-    aliases: List[str]
-    description: str
-    keywords: List[str]
-
-class TableInfo(BaseModel):
-    database_name: str
-    table_name: str
-    aliases: List[str]
-    description: str
-    ddl: str
-    keywords: List[str]
-
-class TableDetails(BaseModel):
-    database_name: str
-    table_name: str
-    field_name: str
-    data_type: str
-    aliases: List[str]
-    description: str
-    keywords: List[str]
-
-class QueryExample(BaseModel):
-    database_name: List[str]
-    query: List[str]
-    description: str
-    keywords: List[str]
-
-class UpdateRequest(BaseModel):
-    items: Union[List[DatabaseInfo], List[TableInfo], List[QueryExample], List[TableDetails]]
-
 @router.post("/database/update/database-info", status_code=status.HTTP_201_CREATED)
 async def update_database_info(
     file: Optional[UploadFile] = File(None),
-    data: Optional[UpdateRequest] = Body(None)
-) -> JSONResponse:
+    data: Optional[UpdateRequest[DatabaseInfo]] = Body(None),
+    db_controller: DBController = Depends(get_db_controller)
+) -> ORJSONResponse:
     """
     Update database information via CSV file (prefixed with 'db_') or JSON object
     """
@@ -61,7 +29,7 @@ async def update_database_info(
             if not file.filename:
                 raise ValueError("Filename is required")
             if not file.filename.startswith("db_info_"):
-                return JSONResponse(
+                return ORJSONResponse(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     content={"detail": "File must be prefixed with 'db_' for database information upload"}
                 )
@@ -70,18 +38,18 @@ async def update_database_info(
         elif data:
             await db_controller.update_database_info(data.items)
         else:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 content={"detail": "Either file or data must be provided"}
             )
             
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_201_CREATED,
             content={"message": "Database information updated successfully"}
         )
         
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"detail": f"Failed to update database info: {str(e)}"}
         )
@@ -90,8 +58,9 @@ async def update_database_info(
 async def update_table_info(
     database_name: str,
     file: Optional[UploadFile] = File(None),
-    data: Optional[UpdateRequest] = Body(None)
-) -> JSONResponse:
+    data: Optional[UpdateRequest[TableInfo]] = Body(None),
+    db_controller: DBController = Depends(get_db_controller)
+) -> ORJSONResponse:
     """
     Update table information via CSV file (prefixed with 'tb_') or JSON object
     """
@@ -101,7 +70,7 @@ async def update_table_info(
             if not file.filename:
                 raise ValueError("Filename is required")
             if not file.filename.startswith("tb_info_"):
-                return JSONResponse(
+                return ORJSONResponse(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     content={"detail": "File must be prefixed with 'tb_' for table information upload"}
                 )
@@ -110,18 +79,18 @@ async def update_table_info(
         elif data:
             await db_controller.update_table_info(database_name, data.items)
         else:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 content={"detail": "Either file or data must be provided"}
             )
             
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_201_CREATED,
             content={"message": "Table information updated successfully"}
         )
         
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"detail": f"Failed to update table info: {str(e)}"}
         )
@@ -132,8 +101,9 @@ async def update_table_details(
         database_name: str,
         table_name: str,
         file: Optional[UploadFile] = File(None),
-        data: Optional[UpdateRequest] = Body(None)
-) -> JSONResponse:
+        data: Optional[UpdateRequest[TableDetails]] = Body(None),
+        db_controller: DBController = Depends(get_db_controller)
+) -> ORJSONResponse:
     """
     Update table details information via CSV file (prefixed with 'tb_details_') or JSON object
     """
@@ -142,7 +112,7 @@ async def update_table_details(
             if not file.filename:
                 raise ValueError("Filename is required")
             if not file.filename.startswith('tb_details_'):
-                return JSONResponse(
+                return ORJSONResponse(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     content={"message": "File name must start with 'tb_details_'"}
                 )
@@ -150,17 +120,17 @@ async def update_table_details(
         elif data:
             await db_controller.update_table_details(database_name, table_name, data.items)
         else:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 content={"message": "Either file or data must be provided"}
             )
 
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_201_CREATED,
             content={"message": "Table details updated successfully"}
         )
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"message": str(e)}
         )
@@ -169,8 +139,9 @@ async def update_table_details(
 async def update_query_examples(
     database_name: str,
     file: Optional[UploadFile] = File(None),
-    data: Optional[UpdateRequest] = Body(None)
-) -> JSONResponse:
+    data: Optional[UpdateRequest[QueryExample]] = Body(None),
+    db_controller: DBController = Depends(get_db_controller)
+) -> ORJSONResponse:
     """
     Update query examples via CSV file (prefixed with 'sample_') or JSON object
     """
@@ -180,7 +151,7 @@ async def update_query_examples(
             if not file.filename:
                 raise ValueError("Filename is required")
             if not file.filename.startswith("query_examples_"):
-                return JSONResponse(
+                return ORJSONResponse(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     content={"detail": "File must be prefixed with 'sample_' for query examples upload"}
                 )
@@ -189,49 +160,104 @@ async def update_query_examples(
         elif data:
             await db_controller.update_query_examples(database_name, data.items)
         else:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 content={"detail": "Either file or data must be provided"}
             )
 
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_201_CREATED,
             content={"message": "Query examples updated successfully"}
         )
         
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"detail": f"Failed to update query examples: {str(e)}"}
         )
 
-@router.get("/database/{database_name}/table/{table_name}/table-details")
-async def list_table_details(database_name: str, table_name: str) -> JSONResponse:
+# Upload file name prefixes and the DBController method and path parameters that handle them
+UPLOAD_HANDLERS = {
+    "db_info_": ("process_database_info", ()),
+    "tb_info_": ("process_table_info", ("database_name",)),
+    "tb_details_": ("process_table_details", ("database_name", "table_name")),
+    "query_examples_": ("process_query_examples", ("database_name",)),
+}
+
+_UPLOAD_PREFIX_RE = re.compile("|".join(map(re.escape, UPLOAD_HANDLERS)))
+
+@router.post("/database/upload", status_code=status.HTTP_201_CREATED)
+async def upload_file(
+    file: UploadFile = File(...),
+    database_name: Optional[str] = None,
+    table_name: Optional[str] = None,
+    db_controller: DBController = Depends(get_db_controller)
+) -> ORJSONResponse:
     """
-    List all table details for a specific table in a database
+    Upload any symantic layer CSV file, dispatched on its file name prefix
     """
     try:
-        table_details = await db_controller.get_table_details(database_name, table_name)
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={"table_details": table_details}
+        if not file.filename:
+            raise ValueError("Filename is required")
+        match = _UPLOAD_PREFIX_RE.match(file.filename)
+        if match is None:
+            return ORJSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"detail": f"File must be prefixed with one of: {', '.join(UPLOAD_HANDLERS)}"}
+            )
+
+        method_name, param_names = UPLOAD_HANDLERS[match.group()]
+        params = {"database_name": database_name, "table_name": table_name}
+        missing = [name for name in param_names if not params[name]]
+        if missing:
+            return ORJSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"detail": f"Missing required parameters: {', '.join(missing)}"}
+            )
+        await getattr(db_controller, method_name)(file, *(params[name] for name in param_names))
+
+        return ORJSONResponse(
+            status_code=status.HTTP_201_CREATED,
+            content={"message": "File uploaded successfully"}
         )
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": f"Failed to upload file: {str(e)}"}
+        )
+
+@router.get("/database/{database_name}/table/{table_name}/table-details", response_model=None)
+async def list_table_details(
+    database_name: str,
+    table_name: str,
+    db_controller: DBController = Depends(get_db_controller)
+) -> Union[Dict[str, List[Dict]], ORJSONResponse]:
+    """
+    List all table details for a specific table in a database
+    """
+    try:
+        return {"table_details": await db_controller.get_table_details(database_name, table_name)}
+    except Exception as e:
+        return ORJSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"message": str(e)}
         )
 
-@router.get("/databases")
-async def list_databases() -> List[str]:
+@router.get("/databases", response_model=None)
+async def list_databases(
+    db_controller: DBController = Depends(get_db_controller)
+) -> List[str]:
     """List all databases in symantic layer"""
     try:
         return await db_controller.list_databases()
     except Exception as e:
         raise Exception(f"Failed to list databases: {str(e)}")
 
-@router.get("/database/{database_name}/tables")
-async def list_tables(database_name: str) -> List[str]:
+@router.get("/database/{database_name}/tables", response_model=None)
+async def list_tables(
+    database_name: str,
+    db_controller: DBController = Depends(get_db_controller)
+) -> List[str]:
     """List all tables in specific database"""
     try:
         return await db_controller.list_tables(database_name)
@@ -240,10 +266,11 @@ async def list_tables(database_name: str) -> List[str]:
             f"Failed to list tables: {str(e)}"
         )
 
-@router.get("/database/{database_name}/query-examples")
+@router.get("/database/{database_name}/query-examples", response_model=None)
 async def list_query_examples(
     database_name: str,
-    table_name: str
+    table_name: str,
+    db_controller: DBController = Depends(get_db_controller)
 ) -> List[Dict]:
     """List sample queries for a database or specific table"""
     try:
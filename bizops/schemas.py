@@ -0,0 +1,63 @@
+from typing import Any, Dict, Generic, List, Optional, TypeVar
+
+from pydantic import BaseModel
+
+
+# nl2sql
+class CompletionsRequest(BaseModel):
+    query: str
+    context: Optional[Dict[str, Any]] = None
+
+class WhisperRequest(BaseModel):
+    instruction: str
+    data: Optional[Dict[str, Any]] = None
+    context: Optional[Dict[str, Any]] = None
+
+# Documents the response schema only, responses are not re-validated against it
+class ResponseWrapper(BaseModel):
+    text: str
+    data: Optional[Dict[str, Any]] = None
+    context: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+class ChatRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+    context: Optional[Dict[str, Any]] = None
+
+
+# symantic layer
+class DatabaseInfo(BaseModel):
+    database_name: str
+    aliases: List[str]
+    description: str
+    keywords: List[str]
+
+class TableInfo(BaseModel):
+    database_name: str
+    table_name: str
+    aliases: List[str]
+    description: str
+    ddl: str
+    keywords: List[str]
+
+class TableDetails(BaseModel):
+    database_name: str
+    table_name: str
+    field_name: str
+    data_type: str
+    aliases: List[str]
+    description: str
+    keywords: List[str]
+
+class QueryExample(BaseModel):
+    database_name: List[str]
+    query: List[str]
+    description: str
+    keywords: List[str]
+
+ItemT = TypeVar("ItemT", bound=BaseModel)
+
+# Each route accepts a single item type, so items are validated against one model
+class UpdateRequest(BaseModel, Generic[ItemT]):
+    items: List[ItemT]
@@ -1,9 +1,14 @@
-from typing import Dict, Any, List, Optional
-from uuid_extensions import uuid7, uuid7str
-import time
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Tuple
+from uuid_extensions import uuid7str
+import asyncio
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from bizops.services.vector import VectorService
-from bizops.services.embedding import EmbeddingService
+from bizops.config import settings
+from bizops.pkg.cache import TTLCache
+from bizops.pkg.timeutil import now_iso
+from bizops.services.vector import get_vector_service
+from bizops.services.embedding import get_embedding_service
 from bizops.services.knowledge_graph import KnowledgeGraphService
 
 class MetadataType(Enum):
@@ -32,6 +37,14 @@ class EdgeType(Enum):
     SIMILAR_TO = "similar_to"
     USED_IN = "used_in"
 
+# Enum values compared inside loops over knowledge graph results
+_NODE_TYPE_INTENTION = NodeType.INTENTION.value
+_NODE_TYPE_TASK = NodeType.TASK.value
+_EDGE_JOINED_WITH = EdgeType.JOINED_WITH.value
+
+class ContextSearchError(Exception):
+    """Raised when a context search fails, chained to the underlying error"""
+
 class ContextRelevance(Enum):
     LOW = 1
     MEDIUM = 2
@@ -40,18 +53,27 @@ class ContextRelevance(Enum):
 
 class ContextAgent:
     def __init__(self):
-        self.vector_service = VectorService()
-        self.embedding_service = EmbeddingService()
+        self.vector_service = get_vector_service()
+        self.embedding_service = get_embedding_service()
         self.knowledge_graph = KnowledgeGraphService()
+        # Knowledge graph entity lookups are independent round trips, so they are fanned out
+        self._lookup_pool = ThreadPoolExecutor(max_workers=settings.KG_LOOKUP_MAX_WORKERS)
+        # In-flight search query embeddings started by prefetch_query_embedding, keyed by intention id
+        self._prefetched_embeddings = TTLCache(maxsize=1024, ttl=60)
+        # Knowledge graph traversal results, keyed by the graph query they were built from
+        self._kg_memory = TTLCache(maxsize=settings.KG_MEMORY_MAX, ttl=settings.KG_MEMORY_TTL_SECONDS)
 
-    def search_database_metadata(self, intention: Dict[str, Any], database_name: str) -> Dict[str, Any]:
+    def search_database_metadata(self, intention: Dict[str, Any], database_name: str,
+                                 query: Optional[str] = None,
+                                 query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
         """
         Search for database metadata based on intention
         Returns information about databases, schemas, tables, and their descriptions
         """
         try:
-            # Extract search query from intention
-            query = self._build_search_query(intention)
+            # Extract search query from intention unless the caller already built it
+            if query is None:
+                query = self._build_search_query(intention)
             
             # Search for database-level metadata
             db_results = self.vector_service.search_similar_documents(
@@ -60,7 +82,8 @@ class ContextAgent:
                     "type": MetadataType.DATABASE_METADATA.value,
                     "database_name": database_name
                 },
-                limit=5
+                limit=5,
+                query_embedding=query_embedding
             )
 
             # Get database description and configuration
@@ -80,21 +103,24 @@ class ContextAgent:
                     "schemas": schema_info
                 },
                 "metadata": {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
-                    "search_id": str(uuid7()),
+                    "timestamp": now_iso(),
+                    "search_id": uuid7str(),
                     "intention_id": intention["id"]
                 }
             }
         except Exception as e:
-            raise Exception(f"Error searching database metadata: {str(e)}")
+            raise ContextSearchError(f"Error searching database metadata: {str(e)}") from e
 
-    def search_table_metadata(self, intention: Dict[str, Any], database_name: str) -> Dict[str, Any]:
+    def search_table_metadata(self, intention: Dict[str, Any], database_name: str,
+                              query: Optional[str] = None,
+                              query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
         """
         Search for relevant table metadata based on intention
         """
         try:
-            # Extract search query from intention
-            query = self._build_search_query(intention)
+            # Extract search query from intention unless the caller already built it
+            if query is None:
+                query = self._build_search_query(intention)
             
             # Search for table metadata
             results = self.vector_service.search_similar_documents(
@@ -103,28 +129,32 @@ class ContextAgent:
                     "type": MetadataType.TABLE_METADATA.value,
                     "database_name": database_name
                 },
-                limit=5
+                limit=5,
+                query_embedding=query_embedding
             )
             
             return {
                 "type": MetadataType.TABLE_METADATA.value,
                 "results": results,
                 "metadata": {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
-                    "search_id": str(uuid7()),
+                    "timestamp": now_iso(),
+                    "search_id": uuid7str(),
                     "intention_id": intention["id"]
                 }
             }
         except Exception as e:
-            raise Exception(f"Error searching table metadata: {str(e)}")
+            raise ContextSearchError(f"Error searching table metadata: {str(e)}") from e
 
-    def search_query_examples(self, intention: Dict[str, Any], database_name: str) -> Dict[str, Any]:
+    def search_query_examples(self, intention: Dict[str, Any], database_name: str,
+                              query: Optional[str] = None,
+                              query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
         """
         Search for relevant query examples based on intention
         """
         try:
-            # Extract search query from intention
-            query = self._build_search_query(intention)
+            # Extract search query from intention unless the caller already built it
+            if query is None:
+                query = self._build_search_query(intention)
             
             # Search for query examples
             results = self.vector_service.search_similar_documents(
@@ -133,20 +163,21 @@ class ContextAgent:
                     "type": MetadataType.QUERY_EXAMPLE.value,
                     "database_name": database_name
                 },
-                limit=3
+                limit=3,
+                query_embedding=query_embedding
             )
             
             return {
                 "type": MetadataType.QUERY_EXAMPLE.value,
                 "results": results,
                 "metadata": {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
-                    "search_id": str(uuid7()),
+                    "timestamp": now_iso(),
+                    "search_id": uuid7str(),
                     "intention_id": intention["id"]
                 }
             }
         except Exception as e:
-            raise Exception(f"Error searching query examples: {str(e)}")
+            raise ContextSearchError(f"Error searching query examples: {str(e)}") from e
 
     def search_database_schema_relationships(self, intention: Dict[str, Any], database_name: str) -> Dict[str, Any]:
         """
@@ -169,121 +200,129 @@ class ContextAgent:
             
             query = " ".join(query_parts)
             
-            # Query knowledge graph
-            kg_response = self.knowledge_graph.query_knowledge_graph(
-                query=query,
-                include_raw=True,
-                response_mode="compact"
-            )
-            
-            # Get specific entity information for each table and field
-            relationships = []
-            join_paths = []
-            
-            # Get table relationships
-            for table in tables:
-                table_info = self.knowledge_graph.get_entity_info(f"{database_name}.{table}")
-                if table_info:
-                    relationships.extend(table_info["relationships"])
-            
-            # Get field relationships
-            for field in fields:
-                if "." in field:
-                    field_info = self.knowledge_graph.get_entity_info(f"{database_name}.{field}")
-                    if field_info:
-                        relationships.extend(field_info["relationships"])
-            
-            # Extract join paths from relationships
-            for rel in relationships:
-                if rel.get("type") == EdgeType.JOINED_WITH.value:
-                    join_paths.append(rel)
-            
-            return {
-                "type": MetadataType.KNOWLEDGE_GRAPH.value,
-                "results": {
+            # The query names every table and field, so a remembered traversal for it is reused
+            memory_key = (MetadataType.KNOWLEDGE_GRAPH, query)
+            results = self._kg_memory.get(memory_key)
+            if results is None:
+                # Query knowledge graph
+                kg_response = self.knowledge_graph.query_knowledge_graph(
+                    query=query,
+                    include_raw=True,
+                    response_mode="compact"
+                )
+                
+                # Get specific entity information for each table and qualified field at once
+                entity_keys = [f"{database_name}.{table}" for table in tables]
+                entity_keys.extend(f"{database_name}.{field}" for field in fields if "." in field)
+                entity_infos, complete = self._get_entity_infos(entity_keys)
+                relationships = list(chain.from_iterable(
+                    entity_info["relationships"] for entity_info in entity_infos if entity_info
+                ))
+                
+                # Extract join paths from relationships
+                join_paths = [rel for rel in relationships if rel.get("type") == _EDGE_JOINED_WITH]
+                
+                results = {
                     "relationships": relationships,
                     "join_paths": join_paths,
                     "kg_response": kg_response["response"],
                     "raw_nodes": kg_response.get("raw_nodes", [])
-                },
+                }
+                # A traversal with failed lookups is returned, but not remembered
+                if complete:
+                    self._kg_memory[memory_key] = results
+            
+            return {
+                "type": MetadataType.KNOWLEDGE_GRAPH.value,
+                "results": dict(results),
                 "metadata": {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
-                    "search_id": str(uuid7()),
+                    "timestamp": now_iso(),
+                    "search_id": uuid7str(),
                     "intention_id": intention["id"]
                 }
             }
         except Exception as e:
-            raise Exception(f"Error searching database schema relationships: {str(e)}")
+            raise ContextSearchError(f"Error searching database schema relationships: {str(e)}") from e
 
-    def search_intention_task_relationships(self, intention: Dict[str, Any]) -> Dict[str, Any]:
+    def search_intention_task_relationships(self, intention: Dict[str, Any],
+                                            query: Optional[str] = None) -> Dict[str, Any]:
         """
         Search knowledge graph for relationships from current intention to other intentions and tasks
         Helps understand how the current intention relates to existing patterns and solutions
         """
         try:
-            # Extract search query from intention
-            query = self._build_search_query(intention)
+            # Extract search query from intention unless the caller already built it
+            if query is None:
+                query = self._build_search_query(intention)
             intent_type = intention["analysis"]["primary_intent"]
             
-            # Query knowledge graph for similar intentions and tasks
-            kg_response = self.knowledge_graph.query_knowledge_graph(
-                query=query,
-                include_raw=True,
-                response_mode="compact"
-            )
+            # The traversal depends only on the query, so a remembered one is reused
+            memory_key = (MetadataType.TASK_RELATIONSHIP, query)
+            results = self._kg_memory.get(memory_key)
+            if results is None:
+                # Query knowledge graph for similar intentions and tasks
+                kg_response = self.knowledge_graph.query_knowledge_graph(
+                    query=query,
+                    include_raw=True,
+                    response_mode="compact"
+                )
             
-            # Get similar intentions
-            similar_intentions = []
-            intention_patterns = []
-            for node in kg_response.get("raw_nodes", []):
-                if node["metadata"].get("type") == NodeType.INTENTION.value:
-                    similar_intentions.append(node)
-                    # Get intention info including patterns
-                    intention_info = self.knowledge_graph.get_entity_info(node["text"])
+                # Split the nodes into similar intentions and candidate tasks in one pass
+                similar_intentions = []
+                task_candidates = []
+                for node in kg_response.get("raw_nodes", []):
+                    node_type = node["metadata"].get("type")
+                    if node_type == _NODE_TYPE_INTENTION:
+                        similar_intentions.append(node)
+                    elif node_type == _NODE_TYPE_TASK:
+                        task_candidates.append(node)
+
+                # Get intention info including patterns, looked up together and reused
+                # for the relationships below
+                intention_infos, intentions_complete = self._get_entity_infos(
+                    [node["text"] for node in similar_intentions]
+                )
+                intention_patterns = []
+                for intention_info in intention_infos:
                     if intention_info and "patterns" in intention_info["metadata"]:
                         intention_patterns.extend(intention_info["metadata"]["patterns"])
             
-            # Get similar tasks based on patterns
-            similar_tasks = []
-            for node in kg_response.get("raw_nodes", []):
-                if (node["metadata"].get("type") == NodeType.TASK.value and
-                    any(pattern in node["metadata"].get("patterns", []) 
-                        for pattern in intention_patterns)):
-                    similar_tasks.append(node)
-            
-            # Get relationships
-            relationships = []
+                # Get similar tasks sharing a pattern with the similar intentions
+                pattern_set = set(intention_patterns)
+                similar_tasks = [
+                    node for node in task_candidates
+                    if not pattern_set.isdisjoint(node["metadata"].get("patterns", ()))
+                ]
+                task_infos, tasks_complete = self._get_entity_infos([node["text"] for node in similar_tasks])
             
-            # Get intention relationships
-            for intention_node in similar_intentions:
-                intention_info = self.knowledge_graph.get_entity_info(intention_node["text"])
-                if intention_info:
-                    relationships.extend(intention_info["relationships"])
-            
-            # Get task relationships
-            for task_node in similar_tasks:
-                task_info = self.knowledge_graph.get_entity_info(task_node["text"])
-                if task_info:
-                    relationships.extend(task_info["relationships"])
-            
-            return {
-                "type": MetadataType.TASK_RELATIONSHIP.value,
-                "results": {
+                # Get intention and task relationships
+                relationships = list(chain.from_iterable(
+                    entity_info["relationships"] for entity_info in chain(intention_infos, task_infos) if entity_info
+                ))
+                
+                results = {
                     "similar_intentions": similar_intentions,
                     "similar_tasks": similar_tasks,
                     "intention_patterns": intention_patterns,
                     "relationships": relationships,
                     "kg_response": kg_response["response"]
-                },
+                }
+                # A traversal with failed lookups is returned, but not remembered
+                if intentions_complete and tasks_complete:
+                    self._kg_memory[memory_key] = results
+            
+            return {
+                "type": MetadataType.TASK_RELATIONSHIP.value,
+                "results": dict(results),
                 "metadata": {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
-                    "search_id": str(uuid7()),
+                    "timestamp": now_iso(),
+                    "search_id": uuid7str(),
                     "intention_id": intention["id"],
                     "intent_type": intent_type
                 }
             }
         except Exception as e:
-            raise Exception(f"Error searching intention and task relationships: {str(e)}")
+            raise ContextSearchError(f"Error searching intention and task relationships: {str(e)}") from e
 
     def enrich_context(self, intention: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -295,48 +334,199 @@ class ContextAgent:
             if not database_name:
                 raise ValueError("Database name not found in intention")
 
+            # The searches share one search query, and the vector searches one embedding of it
+            query = self._build_search_query(intention)
+            query_embedding = self.vector_service.embed_query(query)
+
             # Search all sources
-            db_metadata = self.search_database_metadata(intention, database_name)
-            table_metadata = self.search_table_metadata(intention, database_name)
-            query_examples = self.search_query_examples(intention, database_name)
+            db_metadata = self.search_database_metadata(intention, database_name, query, query_embedding)
+            table_metadata = self.search_table_metadata(intention, database_name, query, query_embedding)
+            query_examples = self.search_query_examples(intention, database_name, query, query_embedding)
             schema_relationships = self.search_database_schema_relationships(intention, database_name)
-            intention_relationships = self.search_intention_task_relationships(intention)
+            intention_relationships = self.search_intention_task_relationships(intention, query)
+
+            return self._combine_context(
+                intention, database_name, db_metadata, table_metadata,
+                query_examples, schema_relationships, intention_relationships
+            )
+        except Exception as e:
+            raise ContextSearchError(f"Error enriching context: {str(e)}") from e
+
+    def prefetch_query_embedding(self, intention: Dict[str, Any]) -> None:
+        """
+        Start embedding the intention's search query in the background
+        A later aenrich_context for the intention awaits it instead of embedding again
+        Must be called from the event loop
+        """
+        if not intention["analysis"].get("database_name"):
+            return
+        query = self._build_search_query(intention)
+        future = asyncio.ensure_future(asyncio.to_thread(self.vector_service.embed_query, query))
+        # Retrieve the error of a prefetch that is never awaited, so it is not logged as unhandled
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._prefetched_embeddings[intention["id"]] = future
+
+    def discard_prefetched_embedding(self, intention_id: str) -> None:
+        """
+        Cancel the prefetched embedding of an intention that will not be enriched
+        A no-op once astream_context has taken it
+        """
+        future = self._prefetched_embeddings.pop(intention_id)
+        if future is not None:
+            future.cancel()
+
+    async def astream_context(self, intention: Dict[str, Any]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Run the context searches concurrently in worker threads
+        Yields (source, result) pairs in completion order, named after the _combine_context arguments
+        """
+        # Get database name from intention
+        database_name = intention["analysis"].get("database_name")
+        if not database_name:
+            raise ValueError("Database name not found in intention")
+
+        # The searches share one search query, and the vector searches one embedding of it
+        query = self._build_search_query(intention)
+        prefetched = self._prefetched_embeddings.pop(intention["id"])
+        if prefetched is not None:
+            query_embedding = await prefetched
+        else:
+            query_embedding = await asyncio.to_thread(self.vector_service.embed_query, query)
+
+        searches = {
+            "db_metadata": (self.search_database_metadata, intention, database_name, query, query_embedding),
+            "table_metadata": (self.search_table_metadata, intention, database_name, query, query_embedding),
+            "query_examples": (self.search_query_examples, intention, database_name, query, query_embedding),
+            "schema_relationships": (self.search_database_schema_relationships, intention, database_name),
+            "intention_relationships": (self.search_intention_task_relationships, intention, query)
+        }
+        tasks = [asyncio.ensure_future(self._run_search(source, *search)) for source, search in searches.items()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def _run_search(source: str, search: Callable[..., Dict[str, Any]], *args: Any) -> Tuple[str, Dict[str, Any]]:
+        return source, await asyncio.to_thread(search, *args)
+
+    async def aenrich_context(self, intention: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async variant of enrich_context
+        Collects the concurrent searches of astream_context
+        """
+        try:
+            results = {source: result async for source, result in self.astream_context(intention)}
+            return self._combine_context(intention, intention["analysis"]["database_name"], **results)
+        except Exception as e:
+            raise ContextSearchError(f"Error enriching context: {str(e)}") from e
+
+    @staticmethod
+    def _combine_context(intention: Dict[str, Any], database_name: str,
+                         db_metadata: Dict[str, Any], table_metadata: Dict[str, Any],
+                         query_examples: Dict[str, Any], schema_relationships: Dict[str, Any],
+                         intention_relationships: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine the search results into the enriched context"""
+        return {
+            "database_context": {
+                "database_metadata": db_metadata["results"],
+                "table_metadata": table_metadata["results"],
+                "query_examples": query_examples["results"],
+                "schema_relationships": schema_relationships["results"]
+            },
+            "task_context": intention_relationships["results"],
+            "metadata": {
+                "timestamp": now_iso(),
+                "context_id": uuid7str(),
+                "intention_id": intention["id"],
+                "database_name": database_name
+            }
+        }
+
+    def refine_context(self, session_id: str, intention: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Refine the context for an intention within a session
+        Database context is only enriched once the intention names a database
+        """
+        try:
+            data = {}
+            if intention["analysis"].get("database_name"):
+                data = self.enrich_context(intention)
 
-            # Combine results
             return {
-                "database_context": {
-                    "database_metadata": db_metadata["results"],
-                    "table_metadata": table_metadata["results"],
-                    "query_examples": query_examples["results"],
-                    "schema_relationships": schema_relationships["results"]
-                },
-                "task_context": intention_relationships["results"],
+                "data": data,
                 "metadata": {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
-                    "context_id": str(uuid7()),
-                    "intention_id": intention["id"],
-                    "database_name": database_name
+                    "timestamp": now_iso(),
+                    "session_id": session_id,
+                    "intention_id": intention["id"]
                 }
             }
         except Exception as e:
-            raise Exception(f"Error enriching context: {str(e)}")
+            raise ContextSearchError(f"Error refining context: {str(e)}") from e
+
+    async def arefine_context(self, session_id: str, intention: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async variant of refine_context
+        Enriches the context with the concurrent searches of aenrich_context
+        """
+        try:
+            data = {}
+            if intention["analysis"].get("database_name"):
+                data = await self.aenrich_context(intention)
+
+            return {
+                "data": data,
+                "metadata": {
+                    "timestamp": now_iso(),
+                    "session_id": session_id,
+                    "intention_id": intention["id"]
+                }
+            }
+        except Exception as e:
+            raise ContextSearchError(f"Error refining context: {str(e)}") from e
+
+    def _get_entity_info(self, key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Look up a knowledge graph entity
+        Returns (info, ok). A failed lookup yields (None, False), a missing entity (None, True)
+        """
+        try:
+            return self.knowledge_graph.get_entity_info(key), True
+        except Exception as e:
+            print(f"Failed to get entity info for {key}: {str(e)}")
+            return None, False
+
+    def _get_entity_infos(self, keys: List[str]) -> Tuple[List[Optional[Dict[str, Any]]], bool]:
+        """
+        Look up several knowledge graph entities concurrently, in the order of keys
+        Returns (infos, complete). A failed lookup yields None in infos and makes complete False,
+        so one failure does not fail the whole search
+        """
+        if len(keys) <= 1:
+            lookups = [self._get_entity_info(key) for key in keys]
+        else:
+            lookups = list(self._lookup_pool.map(self._get_entity_info, keys))
+        return [info for info, _ in lookups], all(ok for _, ok in lookups)
 
     def _build_search_query(self, intention: Dict[str, Any]) -> str:
         """Build natural language query from intention"""
+        analysis = intention["analysis"]
         query_parts = []
         
         # Add primary intent
-        if "primary_intent" in intention["analysis"]:
-            query_parts.append(f"Intent: {intention['analysis']['primary_intent']}")
+        if "primary_intent" in analysis:
+            query_parts.append(f"Intent: {analysis['primary_intent']}")
         
         # Add entities
-        entities = intention["analysis"].get("entities", {})
-        for entity_type, values in entities.items():
-            if values:
-                query_parts.append(f"{entity_type}: {', '.join(values)}")
+        query_parts.extend(
+            f"{entity_type}: {', '.join(values)}"
+            for entity_type, values in analysis.get("entities", {}).items() if values
+        )
         
         # Add constraints
-        constraints = intention["analysis"].get("constraints", [])
+        constraints = analysis.get("constraints")
         if constraints:
             query_parts.append(f"Constraints: {', '.join(constraints)}")
         
@@ -1,7 +1,11 @@
+import asyncio
+from collections import defaultdict
 from typing import Dict, Any, Optional, List
-from uuid_extensions import uuid7, uuid7str
-import time
+from uuid_extensions import uuid7str
+import copy
 from enum import Enum
+from bizops.pkg.cache import TTLCache, hash_context
+from bizops.pkg.timeutil import now_iso
 
 class IntentionType(Enum):
     SQL_QUERY = "sql_query"
@@ -18,22 +22,31 @@ class IntentionStatus(Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+# Shared empty sequence for intention lists that are replaced, never appended to
+_EMPTY: tuple = ()
+
 class IntentionAgent:
     def __init__(self):
         self.intentions: Dict[str, Dict[str, Any]] = {}
+        # Secondary indexes over self.intentions, each an insertion-ordered set of ids
+        self._by_session: Dict[str, Dict[str, None]] = defaultdict(dict)
+        self._by_status: Dict[str, Dict[str, None]] = defaultdict(dict)
+        self._by_parent: Dict[str, Dict[str, None]] = defaultdict(dict)
+        # Completion analyses keyed by (query, context hash)
+        self._analysis_cache = TTLCache(maxsize=1024)
 
     def analyze_completion_intention(self, query: str, 
                                      session_id: str,
-                                     context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                                     context: Optional[Dict[str, Any]] = None,
+                                     cache: bool = True) -> Dict[str, Any]:
         """
         Analyze intention for completion API requests
+        Analyses are reused for repeated (query, context) pairs unless cache is False
         """
         try:
-            intention_id = str(uuid7())
-            current_time = time.strftime("%Y-%m-%dT%H:%M:%S+08:00")
+            intention_id = uuid7str()
+            current_time = now_iso()
             
-            # TODO: Implement actual intention analysis logic
-            # This is a placeholder implementation
             intention = {
                 "id": intention_id,
                 "type": "completion",
@@ -42,21 +55,12 @@ class IntentionAgent:
                     "content": query,
                     "session_id": session_id
                 },
-                "analysis": {
-                    "primary_intent": IntentionType.SQL_QUERY.value,
-                    "sub_intents": [],
-                    "entities": {},
-                    "is_executable": True,
-                    "execution_requirements": {
-                        "needs_clarification": False,
-                        "missing_parameters": []
-                    }
-                },
+                "analysis": self._analyze_completion(query, context, cache),
                 "status": IntentionStatus.PENDING.value,
                 "relationships": {
                     "parent_intention": None,
-                    "child_intentions": [],
-                    "related_intentions": []
+                    "child_intentions": _EMPTY,
+                    "related_intentions": _EMPTY
                 },
                 "metadata": {
                     "intention_id": intention_id,
@@ -65,12 +69,48 @@ class IntentionAgent:
                 }
             }
             
-            self.intentions[intention_id] = intention
+            self._store(intention)
             return intention
             
         except Exception as e:
             raise Exception(f"Error analyzing completion intention: {str(e)}")
 
+    async def aanalyze_completion_intention(self, query: str,
+                                            session_id: str,
+                                            context: Optional[Dict[str, Any]] = None,
+                                            cache: bool = True) -> Dict[str, Any]:
+        """
+        Async variant of analyze_completion_intention, run in a worker thread
+        """
+        return await asyncio.to_thread(self.analyze_completion_intention, query, session_id, context, cache=cache)
+
+    def _analyze_completion(self, query: str, context: Optional[Dict[str, Any]],
+                            cache: bool) -> Dict[str, Any]:
+        """
+        Analyze a completion query, reusing the analysis of an identical earlier request
+        """
+        key = (query, hash_context(context))
+        if cache:
+            cached = self._analysis_cache.get(key)
+            if cached is not None:
+                return copy.deepcopy(cached)
+
+        # TODO: Implement actual intention analysis logic
+        # This is a placeholder implementation
+        analysis = {
+            "primary_intent": IntentionType.SQL_QUERY.value,
+            "sub_intents": _EMPTY,
+            "entities": {},
+            "is_executable": True,
+            "execution_requirements": {
+                "needs_clarification": False,
+                "missing_parameters": _EMPTY
+            }
+        }
+
+        self._analysis_cache[key] = copy.deepcopy(analysis)
+        return analysis
+
     def analyze_chat_intention(self, message: str, 
                                session_id: str,
                                context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -80,8 +120,8 @@ class IntentionAgent:
         May create multiple related intentions
         """
         try:
-            intention_id = str(uuid7())
-            current_time = time.strftime("%Y-%m-%dT%H:%M:%S+08:00")
+            intention_id = uuid7str()
+            current_time = now_iso()
             
             # Get intention history from context if available
             intention_history = context.get("intention_history", []) if context else []
@@ -97,19 +137,19 @@ class IntentionAgent:
                 },
                 "analysis": {
                     "primary_intent": IntentionType.SQL_QUERY.value,
-                    "sub_intents": [],
+                    "sub_intents": _EMPTY,
                     "entities": {},
                     "is_executable": True,
                     "execution_requirements": {
                         "needs_clarification": False,
-                        "missing_parameters": []
+                        "missing_parameters": _EMPTY
                     }
                 },
                 "status": IntentionStatus.PENDING.value,
                 "relationships": {
                     "parent_intention": None,
-                    "child_intentions": [],
-                    "related_intentions": []
+                    "child_intentions": _EMPTY,
+                    "related_intentions": _EMPTY
                 },
                 "metadata": {
                     "intention_id": intention_id,
@@ -118,11 +158,11 @@ class IntentionAgent:
                 }
             }
             
-            self.intentions[intention_id] = primary_intention
+            self._store(primary_intention)
             
             # Predict and create additional intentions if needed
             additional_intentions = self._predict_additional_intentions(
-                message, primary_intention, intention_history
+                message, primary_intention, intention_history, current_time
             )
             
             # Update relationships
@@ -133,7 +173,7 @@ class IntentionAgent:
                 
                 for intention in additional_intentions:
                     intention["relationships"]["parent_intention"] = primary_intention["id"]
-                    self.intentions[intention["id"]] = intention
+                    self._store(intention)
             
             return primary_intention
             
@@ -142,14 +182,40 @@ class IntentionAgent:
 
     def _predict_additional_intentions(self, message: str, 
                                     primary_intention: Dict[str, Any],
-                                    intention_history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+                                    intention_history: List[Dict[str, Any]],
+                                    current_time: str) -> List[Dict[str, Any]]:
         """
         Predict additional intentions based on message and history
+        Predicted intentions share the primary intention's current_time
         """
         # TODO: Implement actual prediction logic
         # This is a placeholder implementation
         return []
 
+    def _store(self, intention: Dict[str, Any]) -> None:
+        """
+        Store an intention and add it to the secondary indexes
+        """
+        intention_id = intention["id"]
+        self.intentions[intention_id] = intention
+        self._by_session[intention["source"]["session_id"]][intention_id] = None
+        self._by_status[intention["status"]][intention_id] = None
+        parent_id = intention["relationships"]["parent_intention"]
+        if parent_id:
+            self._by_parent[parent_id][intention_id] = None
+
+    def get_session_intentions(self, session_id: str) -> List[Dict[str, Any]]:
+        """
+        Get all intentions of a session, in creation order
+        """
+        return [self.intentions[i] for i in self._by_session.get(session_id, ())]
+
+    def get_intentions_by_status(self, status: IntentionStatus) -> List[Dict[str, Any]]:
+        """
+        Get all intentions with the given status
+        """
+        return [self.intentions[i] for i in self._by_status.get(status.value, ())]
+
     def get_intention(self, intention_id: str) -> Optional[Dict[str, Any]]:
         """
         Retrieve a specific intention
@@ -174,10 +240,7 @@ class IntentionAgent:
                 related_intentions.append(parent)
         
         # Get child intentions
-        for child_id in relationships["child_intentions"]:
-            child = self.get_intention(child_id)
-            if child:
-                related_intentions.append(child)
+        related_intentions.extend(self.intentions[i] for i in self._by_parent.get(intention_id, ()))
                 
         # Get other related intentions
         for related_id in relationships["related_intentions"]:
@@ -197,6 +260,8 @@ class IntentionAgent:
         if not intention:
             return False
             
+        self._by_status[intention["status"]].pop(intention_id, None)
+        self._by_status[status.value][intention_id] = None
         intention["status"] = status.value
         if result:
             intention["result"] = result
@@ -1,7 +1,7 @@
 from typing import Dict, Any, Optional, List
-from uuid_extensions import uuid7, uuid7str
-import time
+from uuid_extensions import uuid7str
 from enum import Enum, auto
+from bizops.pkg.timeutil import now_iso
 
 class TaskType(Enum):
     SQL_GENERATION = auto()
@@ -29,7 +29,7 @@ class PlannerAgent:
         Returns a plan with ordered tasks
         """
         try:
-            plan_id = str(uuid7())
+            plan_id = uuid7str()
             
             # Extract relevant information from intention
             intent_type = intention["type"]
@@ -59,7 +59,7 @@ class PlannerAgent:
                 "tasks": tasks,
                 "status": TaskStatus.PENDING.value,
                 "metadata": {
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00"),
+                    "timestamp": now_iso(),
                     "total_tasks": len(tasks)
                 }
             }
@@ -90,7 +90,7 @@ class PlannerAgent:
             # Add schema lookup task if needed
             if entities.get("tables") or entities.get("fields"):
                 tasks.append({
-                    "task_id": str(uuid7()),
+                    "task_id": uuid7str(),
                     "type": TaskType.SCHEMA_LOOKUP.name,
                     "priority": 1,
                     "dependencies": [],
@@ -103,7 +103,7 @@ class PlannerAgent:
             
             # Add main SQL generation task
             tasks.append({
-                "task_id": str(uuid7()),
+                "task_id": uuid7str(),
                 "type": TaskType.SQL_GENERATION.name,
                 "priority": 2,
                 "dependencies": [t["task_id"] for t in tasks],  # Depend on schema lookup if present
@@ -116,7 +116,7 @@ class PlannerAgent:
             
             # Add validation task
             tasks.append({
-                "task_id": str(uuid7()),
+                "task_id": uuid7str(),
                 "type": TaskType.VALIDATION.name,
                 "priority": 3,
                 "dependencies": [tasks[-1]["task_id"]],  # Depend on SQL generation
@@ -141,7 +141,7 @@ class PlannerAgent:
         
         if primary_intent == "clarification":
             tasks.append({
-                "task_id": str(uuid7()),
+                "task_id": uuid7str(),
                 "type": TaskType.CLARIFICATION.name,
                 "priority": 1,
                 "dependencies": [],
@@ -156,7 +156,7 @@ class PlannerAgent:
         elif primary_intent == "refinement":
             # Add task to refine previous query
             tasks.append({
-                "task_id": str(uuid7()),
+                "task_id": uuid7str(),
                 "type": TaskType.REFINEMENT.name,
                 "priority": 1,
                 "dependencies": [],
@@ -171,7 +171,7 @@ class PlannerAgent:
             
             # Add validation task for the refinement
             tasks.append({
-                "task_id": str(uuid7()),
+                "task_id": uuid7str(),
                 "type": TaskType.VALIDATION.name,
                 "priority": 2,
                 "dependencies": [tasks[-1]["task_id"]],
@@ -1,5 +1,7 @@
+import hashlib
 import json
 import os
+from functools import lru_cache
 from typing import List, Dict, Any
 
 import pandas as pd
@@ -8,9 +10,22 @@ from llama_index.core import Document
 from llama_index.vector_stores.postgres import PGVectorStore
 from sqlalchemy import create_engine
 
+from bizops.config import settings
+from bizops.pkg.cache import TTLCache
 from bizops.pkg.models import ModelManager, EmbeddingType
 
 
+def _record_texts(df: pd.DataFrame, labels: Dict[str, str]) -> List[str]:
+    """Join the labelled, non-empty fields of each record, reading each column once"""
+    columns = [(label, df[column].to_numpy()) for column, label in labels.items() if column in df.columns]
+    if not columns:
+        return [""] * len(df)
+    return [
+        "\n".join(f"{label}: {value}" for (label, _), value in zip(columns, values) if value)
+        for values in zip(*(column for _, column in columns))
+    ]
+
+
 class EmbeddingService:
     _embedding_type : EmbeddingType = EmbeddingType.AZURE_EMBEDDING
     
@@ -20,6 +35,11 @@ class EmbeddingService:
         
         # Get embedding model from model manager
         self.embed_model = self.model_manager.get_embedding_model(self._embedding_type)
+        # Search query embeddings, shared with VectorService, since search queries often repeat
+        self._query_embeddings = TTLCache(
+            maxsize=settings.QUERY_EMBEDDING_CACHE_MAX,
+            ttl=settings.QUERY_EMBEDDING_CACHE_TTL_SECONDS
+        )
         
         # Initialize PostgreSQL connection
         self.connection_string = os.getenv(
@@ -49,30 +69,15 @@ class EmbeddingService:
             DataFrame with embeddings added
         """
         try:
-            if "embedding" not in df.columns:
-                df["embedding"] = None  # Initialize the column
-            # Process each record individually
-            for idx, row in df.iterrows():
-                text_parts = []
-                
-                # Add each field to text parts if it exists
-                if 'database_name' in row and row['database_name']:
-                    text_parts.append(f"Database name: {row['database_name']}")
-                
-                if 'aliases' in row and row['aliases']:
-                    text_parts.append(f"Database Aliases: {row['aliases']}")
-                
-                if 'description' in row and row['description']:
-                    text_parts.append(f"Database Description: {row['description']}")
-                
-                if 'keywords' in row and row['keywords']:
-                    text_parts.append(f"Database Keywords: {row['keywords']}")
-                
-                # Combine all text parts and generate embedding
-                combined_text = "\n".join(text_parts)
-                embedding = self.embed_model.get_text_embedding(combined_text)
-                df.at[idx, "embedding"] = embedding
-            
+            # Build the text for each record from the fields it has, then embed them together
+            texts = _record_texts(df, {
+                "database_name": "Database name",
+                "aliases": "Database Aliases",
+                "description": "Database Description",
+                "keywords": "Database Keywords"
+            })
+            
+            df["embedding"] = self.embed_model.get_text_embedding_batch(texts, show_progress=False)
             return df
 
         except Exception as e:
@@ -88,31 +93,15 @@ class EmbeddingService:
             DataFrame with embeddings added
         """
         try:
-            if "embedding" not in df.columns:
-                df["embedding"] = None  # Initialize the column
-            
-            # Process each record individually
-            for idx, row in df.iterrows():
-                text_parts = []
-                
-                # Add each field to text parts if it exists
-                if 'table_name' in row and row['table_name']:
-                    text_parts.append(f"Table name: {row['table_name']}")
-                
-                if 'aliases' in row and row['aliases']:
-                    text_parts.append(f"Table Aliases: {row['aliases']}")
-                
-                if 'keywords' in row and row['keywords']:
-                    text_parts.append(f"Table Keywords: {row['keywords']}")
-
-                if 'description' in row and row['description']:
-                    text_parts.append(f"Table Description: {row['description']}")
-                
-                # Combine all text parts and generate embedding
-                combined_text = "\n".join(text_parts)
-                embedding = self.embed_model.get_text_embedding(combined_text)
-                df.at[idx, "embedding"] = embedding
-            
+            # Build the text for each record from the fields it has, then embed them together
+            texts = _record_texts(df, {
+                "table_name": "Table name",
+                "aliases": "Table Aliases",
+                "keywords": "Table Keywords",
+                "description": "Table Description"
+            })
+            
+            df["embedding"] = self.embed_model.get_text_embedding_batch(texts, show_progress=False)
             return df
 
         except Exception as e:
@@ -128,31 +117,15 @@ class EmbeddingService:
             DataFrame with embeddings added
         """
         try:
-            if "embedding" not in df.columns:
-                df["embedding"] = None  # Initialize the column
-            
-            # Process each record individually
-            for idx, row in df.iterrows():
-                text_parts = []
-                
-                # Add each field to text parts if it exists
-                if 'field_name' in row and row['field_name']:
-                    text_parts.append(f"Field Name: {row['field_name']}")
-
-                if 'aliases' in row and row['aliases']:
-                    text_parts.append(f"Field Aliases: {row['aliases']}")
-
-                if 'keywords' in row and row['keywords']:
-                    text_parts.append(f"Field Keywords: {row['keywords']}")
-
-                if 'description' in row and row['description']:
-                    text_parts.append(f"Field Description: {row['description']}")
-                
-                # Combine all text parts and generate embedding
-                combined_text = "\n".join(text_parts)
-                embedding = self.embed_model.get_text_embedding(combined_text)
-                df.at[idx, "embedding"] = embedding
-            
+            # Build the text for each record from the fields it has, then embed them together
+            texts = _record_texts(df, {
+                "field_name": "Field Name",
+                "aliases": "Field Aliases",
+                "keywords": "Field Keywords",
+                "description": "Field Description"
+            })
+            
+            df["embedding"] = self.embed_model.get_text_embedding_batch(texts, show_progress=False)
             return df
 
         except Exception as e:
@@ -168,28 +141,14 @@ class EmbeddingService:
             DataFrame with embeddings added
         """
         try:
-            if "embedding" not in df.columns:
-                df["embedding"] = None  # Initialize the column
-            
-            # Process each record individually
-            for idx, row in df.iterrows():
-                text_parts = []
-                
-                # Add each field to text parts if it exists
-                if 'database_name' in row and row['database_name']:
-                    text_parts.append(f"Database Name: {row['database_name']}")
-
-                if 'keywords' in row and row['keywords']:
-                    text_parts.append(f"Query Keywords: {row['keywords']}")
-                
-                if 'description' in row and row['description']:
-                    text_parts.append(f"Query Description: {row['description']}")
-                
-                # Combine all text parts and generate embedding
-                combined_text = "\n".join(text_parts)
-                embedding = self.embed_model.get_text_embedding(combined_text)
-                df.at[idx, "embedding"] = embedding
-            
+            # Build the text for each record from the fields it has, then embed them together
+            texts = _record_texts(df, {
+                "database_name": "Database Name",
+                "keywords": "Query Keywords",
+                "description": "Query Description"
+            })
+            
+            df["embedding"] = self.embed_model.get_text_embedding_batch(texts, show_progress=False)
             return df
 
         except Exception as e:
@@ -218,7 +177,7 @@ class EmbeddingService:
             for doc, embedding in zip(documents, embeddings):
                 self.vector_store.add(
                     embedding=embedding,
-                    doc_id=str(hash(doc.text)),
+                    doc_id=hashlib.blake2b(doc.text.encode("utf-8"), digest_size=8).hexdigest(),
                     metadata=json.dumps(doc.metadata)
                 )
             
@@ -228,11 +187,20 @@ class EmbeddingService:
                 detail=f"Failed to create embeddings: {str(e)}"
             )
 
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a search query, ignoring surrounding whitespace"""
+        query = query.strip()
+        embedding = self._query_embeddings.get(query)
+        if embedding is None:
+            embedding = self.embed_model.get_text_embedding(query)
+            self._query_embeddings[query] = embedding
+        return embedding
+
     def search_similar(self, query: str, metadata_filter: Dict = None, top_k: int = 5) -> List[Dict]:
         """Search for similar embeddings"""
         try:
             # Get query embedding
-            query_embedding = self.embed_model.get_text_embedding(query)
+            query_embedding = self.embed_query(query)
             
             # Search in vector store
             results = self.vector_store.similarity_search(
@@ -254,4 +222,10 @@ class EmbeddingService:
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to search embeddings: {str(e)}"
-            )
\ No newline at end of file
+            )
+
+
+@lru_cache(maxsize=None)
+def get_embedding_service() -> EmbeddingService:
+    """Get the shared EmbeddingService"""
+    return EmbeddingService()
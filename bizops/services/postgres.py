@@ -1,16 +1,47 @@
+from contextlib import contextmanager
+from functools import lru_cache
 import pandas as pd
 from pgvector.sqlalchemy import VECTOR
-from sqlalchemy import create_engine, text, ARRAY, String, JSON
-from typing import List, Dict, Any, Optional
+from sqlalchemy import text, ARRAY, String, JSON
+from sqlalchemy.engine import Connection
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Optional
 from bizops.config import settings
-from bizops.services.embedding import EmbeddingService
-import uuid
+from bizops.pkg.db import get_engine
+from bizops.services.embedding import get_embedding_service
+from uuid_extensions import uuid7str
+
+
+def _split_list_column(series: pd.Series) -> pd.Series:
+    """Split comma separated strings into lists of stripped items, leaving other values as is"""
+    if series.dtype != object:
+        return series
+    # JSON updates already carry lists, and a column may mix them with strings and nulls
+    is_str = series.map(lambda value: isinstance(value, str))
+    if not is_str.any():
+        return series
+    split = series[is_str].str.strip().str.split(r"\s*,\s*", regex=True)
+    return series.where(~is_str, split)
+
+
+@contextmanager
+def _staging_table(conn: Connection, prefix: str) -> Iterator[str]:
+    """
+    Name a staging table unique to this write, and drop it once the write is done
+    Concurrent writes to the same target would otherwise share and drop each other's rows
+    """
+    temp_table = f"{prefix}_{uuid7str().replace('-', '')}"
+    try:
+        yield temp_table
+    finally:
+        conn.rollback()
+        conn.execute(text(f"DROP TABLE IF EXISTS {temp_table}"))
+        conn.commit()
 
 
 class PostgresService:
     def __init__(self):
-        self.engine = create_engine(settings.POSTGRES_URL)
-        self.embedding_service = EmbeddingService()
+        self.engine = get_engine()
+        self.embedding_service = get_embedding_service()
         self._ensure_tables_exist()
     
     def _ensure_tables_exist(self):
@@ -145,30 +176,43 @@ class PostgresService:
             """))
             conn.commit()
 
-    def update_database_info(self, df: pd.DataFrame) -> None:
+    def _stage_and_merge(self, conn: Connection, prefix: str, frames: Iterable[pd.DataFrame],
+                         prepare: Callable[[pd.DataFrame], pd.DataFrame],
+                         dtype: Dict[str, Any], merge_sql: str) -> None:
+        """
+        Stage every frame in one staging table, then merge it into the target in a single statement
+        A failure in any frame leaves the target untouched
+        """
+        with _staging_table(conn, prefix) as temp_table:
+            staged = False
+            for df in frames:
+                prepare(df).to_sql(temp_table, conn, if_exists='append', index=False, dtype=dtype,
+                                   chunksize=settings.DB_WRITE_BATCH_SIZE)
+                staged = True
+            if staged:
+                conn.execute(text(merge_sql.format(temp_table=temp_table)))
+                conn.commit()
+
+    def update_database_info(self, frames: Iterable[pd.DataFrame]) -> None:
         """Update database information in PostgreSQL"""
-        try:
-            temp_table = "temp_database_info"
+        def prepare(df: pd.DataFrame) -> pd.DataFrame:
             # Add embeddings to the DataFrame
             df = self.embedding_service.process_database_info(df)
 
             # Convert string to list, then to PostgreSQL array format
-            df['aliases'] = df['aliases'].apply(lambda x: [item.strip() for item in x.split(',')] if isinstance(x, str) else x)
-            df['keywords'] = df['keywords'].apply(lambda x: [item.strip() for item in x.split(',')] if isinstance(x, str) else x)
-            
+            df['aliases'] = _split_list_column(df['aliases'])
+            df['keywords'] = _split_list_column(df['keywords'])
+            return df
+
+        try:
             with self.engine.connect() as conn:
-                conn.execute(text(f"DROP TABLE IF EXISTS {temp_table}"))
-                conn.commit()
-                
                 # Specify the correct data types for array columns
                 dtype = {
                     'aliases': ARRAY(String),
                     'keywords': ARRAY(String),
                     'embedding': VECTOR(1536)
                 }
-                df.to_sql(temp_table, conn, if_exists='replace', index=False, dtype=dtype)
-                
-                conn.execute(text(f"""
+                self._stage_and_merge(conn, "temp_database_info", frames, prepare, dtype, """
                     INSERT INTO database_info (database_name, aliases, description, keywords, embedding)
                     SELECT database_name, aliases, description, keywords, embedding
                     FROM {temp_table}
@@ -178,15 +222,21 @@ class PostgresService:
                         description = EXCLUDED.description,
                         keywords = EXCLUDED.keywords,
                         embedding = EXCLUDED.embedding
-                """))
-                
-                conn.execute(text(f"DROP TABLE {temp_table}"))
-                conn.commit()
+                """)
         except Exception as e:
             raise Exception(f"Failed to update database info: {str(e)}")
 
-    def update_table_info(self, df: pd.DataFrame, database_name: str) -> None:
+    def update_table_info(self, frames: Iterable[pd.DataFrame], database_name: str) -> None:
         """Update table information in PostgreSQL"""
+        def prepare(df: pd.DataFrame) -> pd.DataFrame:
+            # Add embeddings to the DataFrame
+            df = self.embedding_service.process_table_info(df[df['database_name']==database_name])
+
+            # Convert string to list, then to PostgreSQL array format
+            df['aliases'] = _split_list_column(df['aliases'])
+            df['keywords'] = _split_list_column(df['keywords'])
+            return df
+
         try:
             with self.engine.connect() as conn:
                 # Check if the corresponding database info is ready.
@@ -194,26 +244,13 @@ class PostgresService:
                 if result.rowcount == 0:
                     raise Exception(f"Failed to find corresponding database info for current table.")
 
-                # Add embeddings to the DataFrame
-                df = self.embedding_service.process_table_info(df[df['database_name']==database_name])
-
-                # Convert string to list, then to PostgreSQL array format
-                df['aliases'] = df['aliases'].apply(lambda x: [item.strip() for item in x.split(',')] if isinstance(x, str) else x)
-                df['keywords'] = df['keywords'].apply(lambda x: [item.strip() for item in x.split(',')] if isinstance(x, str) else x)
-
-                # Get the temp table prepared.
-                temp_table = "temp_table_info"
-                conn.execute(text(f"DROP TABLE IF EXISTS {temp_table}"))
-                conn.commit()
                 # Specify the correct data types for array columns
                 dtype = {
                     'aliases': ARRAY(String),
                     'keywords': ARRAY(String),
                     'embedding': VECTOR(1536)
                 }
-                df.to_sql(temp_table, conn, if_exists='replace', index=False, dtype=dtype)
-                
-                conn.execute(text(f"""
+                self._stage_and_merge(conn, "temp_table_info", frames, prepare, dtype, """
                     INSERT INTO table_info (
                         database_name, table_name, aliases, description, ddl, keywords, embedding
                     )
@@ -227,15 +264,21 @@ class PostgresService:
                         ddl = EXCLUDED.ddl,
                         keywords = EXCLUDED.keywords,
                         embedding = EXCLUDED.embedding
-                """))
-                
-                conn.execute(text(f"DROP TABLE {temp_table}"))
-                conn.commit()
+                """)
         except Exception as e:
             raise Exception(f"Failed to update table info: {str(e)}")
 
-    def update_table_details(self, df: pd.DataFrame, database_name: str, table_name: str) -> None:
+    def update_table_details(self, frames: Iterable[pd.DataFrame], database_name: str, table_name: str) -> None:
         """Update table details in PostgreSQL"""
+        def prepare(df: pd.DataFrame) -> pd.DataFrame:
+            # Add embeddings to the DataFrame
+            df = self.embedding_service.process_table_details(df[(df['database_name']==database_name) & (df['table_name']==table_name)])
+
+            # Convert string to list, then to PostgreSQL array format
+            df['aliases'] = _split_list_column(df['aliases'])
+            df['keywords'] = _split_list_column(df['keywords'])
+            return df
+
         try:
             with self.engine.connect() as conn:
                 # Check if the corresponding database info is ready.
@@ -248,26 +291,13 @@ class PostgresService:
                 if result.rowcount == 0:
                     raise Exception(f"Failed to find corresponding table for current details.")
 
-                # Add embeddings to the DataFrame
-                df = self.embedding_service.process_table_details(df[(df['database_name']==database_name) & (df['table_name']==table_name)])
-
-                # Convert string to list, then to PostgreSQL array format
-                df['aliases'] = df['aliases'].apply(lambda x: [item.strip() for item in x.split(',')] if isinstance(x, str) else x)
-                df['keywords'] = df['keywords'].apply(lambda x: [item.strip() for item in x.split(',')] if isinstance(x, str) else x)
-
-                temp_table = "temp_table_details"
-                conn.execute(text(f"DROP TABLE IF EXISTS {temp_table}"))
-                conn.commit()
-                
                 # Specify the correct data types for array columns
                 dtype = {
                     'aliases': ARRAY(String),
                     'keywords': ARRAY(String),
                     'embedding': VECTOR(1536)
                 }
-                df.to_sql(temp_table, conn, if_exists='replace', index=False, dtype=dtype)
-                
-                conn.execute(text(f"""
+                self._stage_and_merge(conn, "temp_table_details", frames, prepare, dtype, """
                     INSERT INTO table_details (
                         database_name, table_name, field_name, data_type, 
                         aliases, description, keywords, embedding
@@ -283,15 +313,21 @@ class PostgresService:
                         description = EXCLUDED.description,
                         keywords = EXCLUDED.keywords,
                         embedding = EXCLUDED.embedding
-                """))
-                
-                conn.execute(text(f"DROP TABLE {temp_table}"))
-                conn.commit()
+                """)
         except Exception as e:
             raise Exception(f"Failed to update table details: {str(e)}")
 
-    def update_query_examples(self, df: pd.DataFrame, database_name: str) -> None:
+    def update_query_examples(self, frames: Iterable[pd.DataFrame], database_name: str) -> None:
         """Update query examples in PostgreSQL"""
+        def prepare(df: pd.DataFrame) -> pd.DataFrame:
+            # Add embeddings to the DataFrame
+            df = self.embedding_service.process_query_examples(df[df['database_name'].apply(lambda x: database_name in x)])
+
+            # Convert string to list, then to PostgreSQL array format
+            df['keywords'] = _split_list_column(df['keywords'])
+            df['database_name'] = _split_list_column(df['database_name'])
+            return df
+
         try:
             with self.engine.connect() as conn:
                 # Check if the corresponding database info is ready.
@@ -299,26 +335,13 @@ class PostgresService:
                 if result.rowcount == 0:
                     raise Exception(f"Failed to find corresponding database info for current table.")
 
-                # Add embeddings to the DataFrame
-                df = self.embedding_service.process_query_examples(df[df['database_name'].apply(lambda x: database_name in x)])
-
-                # Convert string to list, then to PostgreSQL array format
-                df['keywords'] = df['keywords'].apply(lambda x: [item.strip() for item in x.split(',')] if isinstance(x, str) else x)
-                df['database_name'] = df['database_name'].apply(lambda x: [item.strip() for item in x.split(',')] if isinstance(x, str) else x)
-
-                temp_table = "temp_query_examples"
-                conn.execute(text(f"DROP TABLE IF EXISTS {temp_table}"))
-                conn.commit()
-                
                 # Specify the correct data types for array columns
                 dtype = {
                     'database_name': ARRAY(String),
                     'keywords': ARRAY(String),
                     'embedding': VECTOR(1536)
                 }
-                df.to_sql(temp_table, conn, if_exists='replace', index=False, dtype=dtype)
-                
-                conn.execute(text(f"""
+                self._stage_and_merge(conn, "temp_query_examples", frames, prepare, dtype, """
                     INSERT INTO query_examples (
                         database_name, query, description, keywords, embedding
                     )
@@ -330,10 +353,7 @@ class PostgresService:
                         description = EXCLUDED.description,
                         keywords = EXCLUDED.keywords,
                         embedding = EXCLUDED.embedding
-                """))
-                
-                conn.execute(text(f"DROP TABLE {temp_table}"))
-                conn.commit()
+                """)
         except Exception as e:
             raise Exception(f"Failed to update query examples: {str(e)}")
 
@@ -487,10 +507,11 @@ class PostgresService:
                     }
                 )
 
-                # Update or insert session variables
+                # Update or insert session variables in a single executemany
+                rows = []
                 for key, value in context.items():
                     value_type = type(value).__name__
-                    data = {
+                    rows.append({
                         "session_id": session_id,
                         "key": key,
                         "value_type": value_type,
@@ -499,8 +520,9 @@ class PostgresService:
                         "boolean_value": bool(value) if value_type == 'bool' else None,
                         "json_value": value if value_type in ('dict', 'list') else None,
                         "updated_at": last_accessed
-                    }
+                    })
 
+                if rows:
                     conn.execute(
                         text("""
                             INSERT INTO session_variables (
@@ -520,7 +542,7 @@ class PostgresService:
                                 json_value = :json_value,
                                 updated_at = :updated_at
                         """),
-                        data
+                        rows
                     )
                 return True
         except Exception as e:
@@ -544,7 +566,7 @@ class PostgresService:
                         )
                     """),
                     {
-                        "message_id": str(uuid.uuid4()),
+                        "message_id": uuid7str(),
                         "session_id": session_id,
                         "message_type": message_type,
                         "content": content,
@@ -625,3 +647,9 @@ class PostgresService:
         except Exception as e:
             print(f"Error cleaning up sessions: {e}")
             return False
+
+
+@lru_cache(maxsize=None)
+def get_postgres_service() -> PostgresService:
+    """Get the shared PostgresService"""
+    return PostgresService()
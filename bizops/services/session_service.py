@@ -1,18 +1,24 @@
+import threading
 from typing import Dict, Any, Optional, List, Tuple
-import uuid
+from uuid_extensions import uuid7str
 from datetime import datetime, timedelta
-import time
-from bizops.services.postgres import PostgresService
+from bizops.config import settings
+from bizops.pkg.cache import TTLCache
+from bizops.pkg.timeutil import now_iso
+from bizops.services.postgres import get_postgres_service
 
 
 class Session:
     def __init__(self, session_id: str, context: Optional[Dict[str, Any]] = None):
         self.session_id = session_id
-        self.context = context or {}
+        # The session keeps its own dict, so later updates never reach the caller's context
+        self.context = dict(context) if context else {}
         self.created_at = datetime.now()
         self.last_accessed = datetime.now()
         self.is_active = True
-        self._db = PostgresService()
+        self._db = get_postgres_service()
+        # Request handlers and the chat history flusher update the context from different threads
+        self._lock = threading.Lock()
         
         # Create session in database
         self._db.create_session(
@@ -23,20 +29,34 @@ class Session:
         )
 
     def update_last_accessed(self):
-        self.last_accessed = datetime.now()
-        self._db.update_session(
-            session_id=self.session_id,
-            context=self.context,
-            last_accessed=self.last_accessed.isoformat()
-        )
+        with self._lock:
+            self.last_accessed = datetime.now()
+            self._db.update_session(
+                session_id=self.session_id,
+                context=self.context,
+                last_accessed=self.last_accessed.isoformat()
+            )
 
     def update_context(self, new_context: Dict[str, Any]):
-        self.context.update(new_context)
-        self._db.update_session(
-            session_id=self.session_id,
-            context=self.context,
-            last_accessed=self.last_accessed.isoformat()
-        )
+        with self._lock:
+            self.context.update(new_context)
+            self._db.update_session(
+                session_id=self.session_id,
+                context=self.context,
+                last_accessed=self.last_accessed.isoformat()
+            )
+
+    def extend_chat_history(self, messages: List[Dict[str, Any]], max_turns: int):
+        """Append messages to the chat history, keeping only the most recent max_turns"""
+        with self._lock:
+            # Swap in a new list, so a history list handed out earlier never changes
+            history = [*self.context.get("chat_history", ()), *messages]
+            self.context["chat_history"] = history[-max_turns:]
+            self._db.update_session(
+                session_id=self.session_id,
+                context=self.context,
+                last_accessed=self.last_accessed.isoformat()
+            )
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -65,24 +85,32 @@ class Session:
 
 class SessionService:
     def __init__(self, session_timeout: int = 30):  # timeout in minutes
-        self._db = PostgresService()
+        self._db = get_postgres_service()
         self.session_timeout = timedelta(minutes=session_timeout)
+        # Recently used sessions, so hot sessions skip the database round trip
+        self._sessions = TTLCache(maxsize=settings.SESSION_CACHE_MAX, ttl=settings.SESSION_TTL_SECONDS)
 
     def create_session(self, context: Optional[Dict[str, Any]] = None) -> Session:
-        session_id = str(uuid.uuid4())
-        return Session(session_id=session_id, context=context)
+        session_id = uuid7str()
+        session = Session(session_id=session_id, context=context)
+        self._sessions[session_id] = session
+        return session
 
     def get_session(self, session_id: str) -> Optional[Session]:
         """
         Get a session by ID. Returns None if session doesn't exist or is expired.
         """
-        session_data = self._db.get_session(session_id)
-        if not session_data:
-            return None
-            
-        session = Session.from_db(session_data)
+        try:
+            session = self._sessions[session_id]
+        except KeyError:
+            session_data = self._db.get_session(session_id)
+            if not session_data:
+                return None
+            session = Session.from_db(session_data)
+
         if session and session.is_active:
             session.update_last_accessed()
+            self._sessions[session_id] = session
             return session
         return None
 
@@ -90,14 +118,19 @@ class SessionService:
         """
         End a session. Returns True if session was ended, False if it doesn't exist.
         """
+        self._sessions.pop(session_id)
         return self._db.end_session(session_id)
 
     def cleanup_expired_sessions(self) -> None:
         """
         Clean up expired sessions based on timeout.
         """
-        expiry_time = (datetime.now() - self.session_timeout).isoformat()
-        self._db.cleanup_expired_sessions(expiry_time)
+        expiry = datetime.now() - self.session_timeout
+        for session in self._sessions.values():
+            # Sessions loaded from the database carry a timezone, new ones don't
+            if session.last_accessed.timestamp() < expiry.timestamp():
+                self._sessions.pop(session.session_id)
+        self._db.cleanup_expired_sessions(expiry.isoformat())
 
     def get_chat_history(self, session_id: str) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
         """
@@ -114,18 +147,21 @@ class SessionService:
         Add a message to the session's chat history.
         Returns (success, error_message). If error_message is not None, success will be False.
         """
+        return self.add_to_chat_history_bulk(session_id, [message])
+
+    def add_to_chat_history_bulk(self, session_id: str, messages: List[Dict[str, Any]]) -> Tuple[bool, Optional[str]]:
+        """
+        Add several messages to the session's chat history with a single session update.
+        Messages that already carry a timestamp keep it.
+        Returns (success, error_message). If error_message is not None, success will be False.
+        """
         session = self.get_session(session_id)
         if not session:
             return False, "Session not found or expired"
         
-        if "chat_history" not in session.context:
-            session.context["chat_history"] = []
-        
-        session.context["chat_history"].append({
-            **message,
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+08:00")
-        })
-        
-        # Update session in database
-        session.update_context(session.context)
+        timestamp = now_iso()
+        session.extend_chat_history(
+            [{"timestamp": timestamp, **message} for message in messages],
+            settings.HISTORY_MAX_TURNS
+        )
         return True, None
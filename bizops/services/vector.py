@@ -1,16 +1,18 @@
+from functools import lru_cache
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from bizops.config import settings
-from bizops.services.embedding import EmbeddingService
+from bizops.pkg.db import get_engine
+from bizops.services.embedding import get_embedding_service
 from llama_index.vector_stores.postgres import PGVectorStore
 from llama_index.core.schema import Document
 
 class VectorService:
     def __init__(self):
-        self.engine = create_engine(settings.POSTGRES_URL)
-        self.embedding_service = EmbeddingService()
+        self.engine = get_engine()
+        self.embedding_service = get_embedding_service()
         self.vector_store = PGVectorStore.from_params(
             database="nl2sql_vectors",
             host=settings.DB_HOST,
@@ -140,11 +142,19 @@ class VectorService:
         except Exception as e:
             raise Exception(f"Failed to update query examples: {str(e)}")
 
-    def search_similar_documents(self, query: str, filter_metadata: Dict[str, Any] = None, limit: int = 5) -> List[Dict[str, Any]]:
-        """Search for similar documents in the vector store"""
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a search query, so several searches can share one embedding"""
+        # Search queries are built deterministically from intentions and often repeat,
+        # so they go through the embedding service's query cache
+        return self.embedding_service.embed_query(query)
+
+    def search_similar_documents(self, query: str, filter_metadata: Dict[str, Any] = None, limit: int = 5,
+                                 query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Search for similar documents in the vector store, reusing query_embedding when given"""
         try:
             # Get embedding for the query
-            query_embedding = self.embedding_service.get_embeddings([query])[0]
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
             
             # Search in vector store
             results = self.vector_store.similarity_search_with_score(
@@ -225,3 +235,9 @@ class VectorService:
             
         except Exception as e:
             raise Exception(f"Failed to update table details vectors: {str(e)}")
+
+
+@lru_cache(maxsize=None)
+def get_vector_service() -> VectorService:
+    """Get the shared VectorService"""
+    return VectorService()
@@ -0,0 +1,40 @@
+import time
+
+from bizops.pkg.cache import TTLCache, hash_context
+
+def test_ttl_cache_evicts_least_recently_used():
+    """The least recently used entry is evicted once maxsize is exceeded"""
+    cache = TTLCache(maxsize=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache["a"] == 1
+    cache["c"] = 3
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+def test_ttl_cache_expires_entries():
+    """Entries expire ttl seconds after they were set"""
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache["a"] = 1
+    assert cache["a"] == 1
+    time.sleep(0.1)
+    assert "a" not in cache
+    assert cache.get("a", "missing") == "missing"
+
+def test_ttl_cache_pop():
+    """pop removes an entry and falls back to the default for a missing key"""
+    cache = TTLCache(maxsize=2)
+    cache["a"] = 1
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    assert cache.pop("a", 0) == 0
+
+def test_hash_context_ignores_chat_history():
+    """Contexts that differ only in chat history hash the same"""
+    context = {"database_name": "assets_maintenance", "filters": {"status": "active"}}
+    with_history = dict(context, chat_history=[{"role": "user", "content": "hello"}])
+    assert hash_context(context) == hash_context(with_history)
+    assert hash_context({"chat_history": []}) is None
+    assert hash_context(context) != hash_context({"database_name": "sales"})
@@ -0,0 +1,23 @@
+import pandas as pd
+
+from bizops.services.postgres import _split_list_column
+
+def test_split_list_column_strings():
+    """Comma separated strings are split into stripped items"""
+    series = pd.Series([" a , b", "c"])
+    assert _split_list_column(series).tolist() == [["a", "b"], ["c"]]
+
+def test_split_list_column_lists():
+    """Columns that already hold lists, as JSON updates produce, are left as is"""
+    series = pd.Series([["a", "b"], ["c"]])
+    assert _split_list_column(series).tolist() == [["a", "b"], ["c"]]
+
+def test_split_list_column_nulls():
+    """Columns holding only nulls are left as is"""
+    series = pd.Series([None, None])
+    assert _split_list_column(series).tolist() == [None, None]
+
+def test_split_list_column_mixed():
+    """Only the string rows of a mixed column are split"""
+    series = pd.Series(["a,b", ["x"], None])
+    assert _split_list_column(series).tolist() == [["a", "b"], ["x"], None]
@@ -0,0 +1,41 @@
+import time
+
+from bizops.pkg.semantic_cache import SemanticCache
+
+def test_semantic_cache_threshold():
+    """Lookups hit only when the cosine similarity reaches the threshold"""
+    cache = SemanticCache(maxsize=4, threshold=0.9)
+    cache.put([1.0, 0.0], "stored")
+    assert cache.get([2.0, 0.1]) == "stored"
+    assert cache.get([1.0, 1.0]) is None
+    assert cache.get([0.0, 1.0]) is None
+
+def test_semantic_cache_scope_isolation():
+    """Entries are only returned for the scope they were stored under"""
+    cache = SemanticCache(maxsize=4)
+    cache.put([1.0, 0.0], "first", scope="session-1")
+    cache.put([1.0, 0.0], "second", scope="session-2")
+    assert cache.get([1.0, 0.0], scope="session-1") == "first"
+    assert cache.get([1.0, 0.0], scope="session-2") == "second"
+    assert cache.get([1.0, 0.0], scope="session-3") is None
+
+def test_semantic_cache_expires_entries():
+    """Entries expire ttl seconds after they were stored"""
+    cache = SemanticCache(maxsize=4, ttl=0.05)
+    cache.put([1.0, 0.0], "stored")
+    assert len(cache) == 1
+    time.sleep(0.1)
+    assert cache.get([1.0, 0.0]) is None
+    assert len(cache) == 0
+
+def test_semantic_cache_replaces_least_recently_used():
+    """A full cache replaces the least recently used entry"""
+    cache = SemanticCache(maxsize=2)
+    cache.put([1.0, 0.0], "a")
+    cache.put([0.0, 1.0], "b")
+    assert cache.get([1.0, 0.0]) == "a"
+    cache.put([-1.0, 0.0], "c")
+    assert cache.get([0.0, 1.0]) is None
+    assert cache.get([1.0, 0.0]) == "a"
+    assert cache.get([-1.0, 0.0]) == "c"
+    assert len(cache) == 2
@@ -77,3 +77,54 @@ def test_upload_query_examples():
         )
     assert response.status_code == 201
     assert response.json() == {"message": "Query examples updated successfully"}
+
+def test_upload_dispatches_on_file_prefix():
+    """Test uploading each kind of CSV through the prefix-dispatched upload endpoint"""
+    uploads = [
+        ('db_info_assets_maintenance.csv', {}),
+        ('tb_info_assets_maintenance.csv', {"database_name": "assets_maintenance"}),
+        ('tb_details_Assets.csv', {"database_name": "assets_maintenance", "table_name": "Assets"}),
+        ('query_examples_asset_maintenance.csv', {"database_name": "assets_maintenance"}),
+    ]
+    for filename, params in uploads:
+        csv_path = os.path.join(SAMPLE_CSV_DIR, filename)
+        with open(csv_path, 'rb') as f:
+            response = client.post(
+                "/api/v1/symantic-layer/database/upload",
+                params=params,
+                files={"file": (filename, f, "text/csv")}
+            )
+        assert response.status_code == 201, filename
+        assert response.json() == {"message": "File uploaded successfully"}
+
+def test_upload_rejects_unknown_prefix():
+    """Test that the upload endpoint rejects a file name without a known prefix"""
+    csv_path = os.path.join(SAMPLE_CSV_DIR, 'db_info_assets_maintenance.csv')
+    with open(csv_path, 'rb') as f:
+        response = client.post(
+            "/api/v1/symantic-layer/database/upload",
+            files={"file": ("assets_maintenance.csv", f, "text/csv")}
+        )
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("File must be prefixed with one of:")
+
+def test_upload_rejects_missing_parameters():
+    """Test that the upload endpoint requires the parameters of the file's prefix"""
+    csv_path = os.path.join(SAMPLE_CSV_DIR, 'tb_info_assets_maintenance.csv')
+    with open(csv_path, 'rb') as f:
+        response = client.post(
+            "/api/v1/symantic-layer/database/upload",
+            files={"file": ("tb_info_assets_maintenance.csv", f, "text/csv")}
+        )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Missing required parameters: database_name"}
+
+    csv_path = os.path.join(SAMPLE_CSV_DIR, 'tb_details_Assets.csv')
+    with open(csv_path, 'rb') as f:
+        response = client.post(
+            "/api/v1/symantic-layer/database/upload",
+            params={"database_name": "assets_maintenance"},
+            files={"file": ("tb_details_Assets.csv", f, "text/csv")}
+        )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Missing required parameters: table_name"}